@@ -2,8 +2,15 @@ from __future__ import annotations
 from dataclassy import dataclass
 from enum import Enum, auto
 from igo.serialization import JsonifyableBase, JsonifyableBaseDataClass
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from copy import deepcopy
+from functools import lru_cache
+import pickle
+
+# pickle protocol used for storing games. it is pinned rather than set to
+# pickle.HIGHEST_PROTOCOL so that game servers running different python versions
+# can always read each other's writes
+PICKLE_PROTOCOL = 5
 
 
 class Color(Enum):
@@ -13,7 +20,7 @@ class Color(Enum):
     def inverse(self) -> Color:
         """Return white if black and black if white"""
 
-        return Color.black if self is Color.white else Color.white
+        return self._inverse
 
     def to_short(self) -> str:
         """Return the first letter of the color name for compact serialization"""
@@ -27,10 +34,24 @@ class Color(Enum):
 
         if not short_name:
             return None
-        for c in Color:
-            if c.to_short() == short_name:
-                return c
-        raise ValueError(f"'{short_name}' is not a valid short Color name")
+        try:
+            return _COLORS_BY_SHORT_NAME[short_name]
+        except KeyError:
+            raise ValueError(
+                f"'{short_name}' is not a valid short Color name"
+            ) from None
+
+
+# called for every point on the board when deserializing, so look names up
+# directly rather than scanning the enum
+_COLORS_BY_SHORT_NAME = {c.to_short(): c for c in Color}
+# likewise serializing, where empty points have no short name
+_SHORT_NAMES = {None: "", **{c: c.to_short() for c in Color}}
+
+# inverse is called on every move and opponent test, and looking members up on
+# the enum class is comparatively slow, so each color holds its inverse
+Color.white._inverse = Color.black
+Color.black._inverse = Color.white
 
 
 class ActionType(Enum):
@@ -179,10 +200,10 @@ class Point(JsonifyableBaseDataClass):
         """Return a representation which can be readily JSONified"""
 
         return [
-            ("" if not self.color else self.color.to_short()),
+            _SHORT_NAMES[self.color],
             self.marked_dead,
             self.counted,
-            ("" if not self.counts_for else self.counts_for.to_short()),
+            _SHORT_NAMES[self.counts_for],
         ]
 
     @classmethod
@@ -197,6 +218,40 @@ class Point(JsonifyableBaseDataClass):
         return Point(self.color, self.marked_dead, self.counted, self.counts_for)
 
 
+# every possible point state, i.e. (color, marked_dead, counted, counts_for),
+# and its index in this list, which fits in a single byte. used to pickle boards
+# compactly (see `Board.__getstate__`)
+_POINT_STATES: List[Tuple[Optional[Color], bool, bool, Optional[Color]]] = [
+    (color, marked_dead, counted, counts_for)
+    for color in (None, *Color)
+    for marked_dead in (False, True)
+    for counted in (False, True)
+    for counts_for in (None, *Color)
+]
+_POINT_STATE_INDICES = {state: i for i, state in enumerate(_POINT_STATES)}
+
+
+@lru_cache(maxsize=None)
+def _neighbors(size: int) -> List[List[Tuple[Tuple[int, int], ...]]]:
+    """
+    Return the in bounds points adjacent to each point of a board of `size`,
+    such that `_neighbors(size)[i][j]` are those of (i, j). They never change,
+    so flood fills can look them up rather than bounds checking every step
+    """
+
+    return [
+        [
+            tuple(
+                (ii, jj)
+                for ii, jj in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1))
+                if 0 <= ii < size and 0 <= jj < size
+            )
+            for j in range(size)
+        ]
+        for i in range(size)
+    ]
+
+
 class Board(JsonifyableBase):
     """
     Subscriptable 2d container class for the full board. `Board()[i][j] -> Point`
@@ -219,11 +274,6 @@ class Board(JsonifyableBase):
         def __repr__(self) -> str:
             return str(self._row)
 
-        def __eq__(self, other: object) -> bool:
-            if not isinstance(other, Board._BoardRow):
-                return False
-            return self._row == other._row
-
         def jsonifyable(self) -> List[str]:
             """Return a representation which can be readily JSONified"""
 
@@ -256,28 +306,56 @@ class Board(JsonifyableBase):
         return str(self._rows)
 
     def __eq__(self, other: object) -> bool:
+        """Color equality only (see `Point.__eq__`), compared point by point
+        in a single pass rather than dispatching through each row and point"""
+
         if not isinstance(other, Board):
             return False
         return self.size == other.size and all(
-            r == o for r, o in zip(self._rows, other._rows)
+            p.color is o.color
+            for row, other_row in zip(self._rows, other._rows)
+            for p, o in zip(row._row, other_row._row)
         )
 
     def jsonifyable(self) -> List[List[str]]:
         """Return a representation which can be readily JSONified"""
 
-        return {"size": self.size, "points": [r.jsonifyable() for r in self._rows]}
+        # serialize points inline rather than through each row and point, as
+        # this is done for every point whenever game state is sent to clients
+        return {
+            "size": self.size,
+            "points": [
+                [
+                    [
+                        _SHORT_NAMES[p.color],
+                        p.marked_dead,
+                        p.counted,
+                        _SHORT_NAMES[p.counts_for],
+                    ]
+                    for p in row._row
+                ]
+                for row in self._rows
+            ],
+        }
 
     def __deepcopy__(self, memo: Dict) -> Board:
         """
         NOTE: a naive deepcopy of board was the single most expensive operation
         the game server was undertaking in profiling runs. implementing
         __deepcopy__ for Board and its attributes shaves this down by about a
-        factor of 10
+        factor of 10. copying the points here directly, rather than calling
+        deepcopy on each row and point, cuts it to about a third again
         """
 
         dup: Board = self.__new__(self.__class__)
         dup.size = self.size
-        dup._rows = [deepcopy(r, memo) for r in self._rows]
+        dup._rows = []
+        for row in self._rows:
+            dup_row: Board._BoardRow = Board._BoardRow.__new__(Board._BoardRow)
+            dup_row._row = [
+                Point(p.color, p.marked_dead, p.counted, p.counts_for) for p in row._row
+            ]
+            dup._rows.append(dup_row)
         return dup
 
     @classmethod
@@ -287,6 +365,39 @@ class Board(JsonifyableBase):
         self._rows = [Board._BoardRow.deserialize(row) for row in data["points"]]
         return self
 
+    def __getstate__(self) -> Tuple[int, bytes]:
+        """
+        Pickle the board as its size and one byte per point, rather than as
+        size**2 individual point objects, which the default implementation
+        would do. Games pickle two boards (see `Game._prev_board`), so this
+        makes game pickles many times smaller and faster in both directions
+        """
+
+        return (
+            self.size,
+            bytes(
+                _POINT_STATE_INDICES[(p.color, p.marked_dead, p.counted, p.counts_for)]
+                for row in self._rows
+                for p in row._row
+            ),
+        )
+
+    def __setstate__(self, state: Tuple) -> None:
+        """Inverse of `__getstate__`, which also accepts boards pickled in the
+        default format for slotted classes, i.e. `(None, slot_state)`"""
+
+        if state[0] is None:
+            for slot, value in state[1].items():
+                setattr(self, slot, value)
+            return
+
+        self.size, points = state
+        self._rows = []
+        for i in range(0, len(points), self.size):
+            row: Board._BoardRow = Board._BoardRow.__new__(Board._BoardRow)
+            row._row = [Point(*_POINT_STATES[p]) for p in points[i : i + self.size]]
+            self._rows.append(row)
+
 
 class Game(JsonifyableBase):
     """
@@ -332,6 +443,7 @@ class Game(JsonifyableBase):
         "pending_request",
         "result",
         "_prev_board",
+        "_pickle_cache",
     )
 
     def __init__(self, size: int = 19, komi: float = 6.5) -> None:
@@ -345,6 +457,7 @@ class Game(JsonifyableBase):
         self.pending_request: Optional[Request] = None
         self.result: Optional[Result] = None
         self._prev_board: Board = None
+        self._pickle_cache: Optional[Tuple[int, bytes]] = None
 
     def __repr__(self) -> str:
         return (
@@ -377,6 +490,43 @@ class Game(JsonifyableBase):
             and self.action_stack == o.action_stack
         )
 
+    def __getstate__(self) -> Tuple[None, Dict[str, Any]]:
+        """Pickle all slots except `_pickle_cache`, which would otherwise nest
+        every previous pickle inside of the next. The `(None, slot_state)`
+        format is the same one produced by default for slotted classes"""
+
+        return (
+            None,
+            {
+                slot: getattr(self, slot)
+                for slot in Game.__slots__
+                if slot != "_pickle_cache"
+            },
+        )
+
+    def __setstate__(self, state: Tuple[None, Dict[str, Any]]) -> None:
+        """Inverse of `__getstate__`, which also accepts games pickled before
+        `_pickle_cache` existed"""
+
+        _, slot_state = state
+        for slot, value in slot_state.items():
+            setattr(self, slot, value)
+        self._pickle_cache = None
+
+    def pickled(self) -> bytes:
+        """Return the pickled form of this game. As the version fully
+        determines the game state (see `__eq__` for caveats), the result is
+        cached and reused until the version changes, so that the same game
+        state is never pickled more than once"""
+
+        version = self.version()
+        if self._pickle_cache is None or self._pickle_cache[0] != version:
+            self._pickle_cache = (
+                version,
+                pickle.dumps(self, protocol=PICKLE_PROTOCOL),
+            )
+        return self._pickle_cache[1]
+
     def take_action(self, action: Action) -> Tuple[bool, str]:
         """Attempt to take an action. Return a tuple of True if that action
         was valid and False otherwise, and an explanatory message in either
@@ -385,24 +535,13 @@ class Game(JsonifyableBase):
         if self.action_stack:
             assert self.action_stack[-1].timestamp <= action.timestamp
 
-        if action.action_type is ActionType.place_stone:
-            success, msg = self._place_stone(action)
-        elif action.action_type is ActionType.pass_turn:
-            success, msg = self._pass_turn(action)
-        elif action.action_type is ActionType.resign:
-            success, msg = self._resign(action)
-        elif action.action_type is ActionType.mark_dead:
-            success, msg = self._mark_dead(action)
-        elif action.action_type is ActionType.request_draw:
-            success, msg = self._request_draw(action)
-        elif action.action_type is ActionType.request_tally_score:
-            success, msg = self._request_tally_score(action)
-        elif action.action_type is ActionType.accept:
-            success, msg = self._respond(action)
-        elif action.action_type is ActionType.reject:
-            success, msg = self._respond(action)
-        else:
-            raise RuntimeError(f"Unknown ActionType encountered: {action.action_type}")
+        try:
+            handler = _ACTION_HANDLERS[action.action_type]
+        except KeyError:
+            raise RuntimeError(
+                f"Unknown ActionType encountered: {action.action_type}"
+            ) from None
+        success, msg = handler(self, action)
 
         if success:
             self.action_stack.append(action)
@@ -432,37 +571,59 @@ class Game(JsonifyableBase):
         if self.board[i][j].color:
             return (False, f"Point {coords} is occupied")
 
-        # we will proceed by copying the board and then placing this stone.
-        # first, we remove any captured stones. if we don't remove anything in
-        # this way, we check if the group that the placed stone is part of is
-        # not surrounded (no suicide rule). finally, we check that the board
-        # has not returned to the last previous board position (simple ko). if
-        # the move is in fact legal, we cycle in the new board position, update
-        # prisoner counts if any stones were captured, and cycle the turn
-        # attribute
-
-        new_board: Board = deepcopy(self.board)
-        new_board[i][j].color = color
+        # we will proceed by placing this stone. first, we find any stones it
+        # captures. if it doesn't capture anything, we check if the group that
+        # the placed stone is part of is not surrounded (no suicide rule).
+        # finally, we check that the board would not return to the last
+        # previous board position (simple ko). if the move is in fact legal, we
+        # cycle in the new board position, update prisoner counts if any stones
+        # were captured, and cycle the turn attribute
+        #
+        # copying the board is by far the most expensive part of this, and
+        # legal_moves tries every point, so rather than working on a copy, we
+        # place the stone on the current board only for as long as it takes to
+        # check the move. only a legal move which isn't a dry run is copied
+
+        board = self.board
+        neighbors = _neighbors(board.size)[i][j]
         opponent = color.inverse()
-        captured = 0
-
-        for ii, jj in self._adjacencies(i, j):
-            if new_board[ii][jj].color is opponent:
-                (group, alive) = self._gather(ii, jj, new_board)
-                if not alive:
-                    for iii, jjj in group:
-                        new_board[iii][jjj].color = None
-                    captured += len(group)
-
-        if not captured and not self._gather(i, j, new_board)[1]:
-            return (False, f"Playing at {coords} is suicide")
-
-        if new_board == self._prev_board:
-            return (False, f"Playing at {coords} violates the simple ko rule")
+        captured: Set[Tuple[int, int]] = set()
+        # opponent stones whose group has already been flooded, so that each
+        # adjacent group is gathered once however many sides it touches
+        seen: Set[Tuple[int, int]] = set()
+
+        board[i][j].color = color
+        try:
+            for ii, jj in neighbors:
+                if board[ii][jj].color is opponent and (ii, jj) not in seen:
+                    (group, alive) = self._gather(ii, jj, board)
+                    seen |= group
+                    if not alive:
+                        captured |= group
+
+            # a stone with an empty neighbor has a liberty, so only a stone
+            # hemmed in on every side needs its group flooded
+            if (
+                not captured
+                and all(board[ii][jj].color is not None for ii, jj in neighbors)
+                and not self._gather(i, j, board)[1]
+            ):
+                return (False, f"Playing at {coords} is suicide")
+
+            if self._repeats_prev_board(i, j, captured):
+                return (False, f"Playing at {coords} violates the simple ko rule")
+
+            if not dry_run:
+                new_board: Board = deepcopy(board)
+
+        finally:
+            board[i][j].color = None
 
         if not dry_run:
+            for ii, jj in captured:
+                new_board[ii][jj].color = None
             self._prev_board, self.board = self.board, new_board
-            self.prisoners[color] += captured
+            self.prisoners[color] += len(captured)
             self.turn = self.turn.inverse()
 
         return (
@@ -470,6 +631,26 @@ class Game(JsonifyableBase):
             f"Successfully placed a {color.name} stone at {coords}",
         )
 
+    def _repeats_prev_board(
+        self, i: int, j: int, captured: Set[Tuple[int, int]]
+    ) -> bool:
+        """Return whether the current board, less the stones at `captured`,
+        is the same position as the previous board. Equivalent to comparing a
+        copy of the board with `captured` removed against `_prev_board`. The
+        stone just placed at `(i, j)` is checked first, which settles almost
+        every move without walking the board"""
+
+        prev_board = self._prev_board
+        if prev_board is None or prev_board.size != self.board.size:
+            return False
+        if prev_board[i][j].color is not self.board[i][j].color:
+            return False
+        return all(
+            (None if (i, j) in captured else p.color) is prev_p.color
+            for i, (row, prev_row) in enumerate(zip(self.board._rows, prev_board._rows))
+            for j, (p, prev_p) in enumerate(zip(row._row, prev_row._row))
+        )
+
     def legal_moves(self, color: Color) -> List[Tuple[int, int]]:
         """
         Return a list of all legal moves for `color`
@@ -554,19 +735,19 @@ class Game(JsonifyableBase):
             num_marked = 0
             color = None
 
-            for i in range(self.board.size):
-                for j in range(self.board.size):
-                    if self.board[i][j].marked_dead:
+            for row in self.board._rows:
+                for point in row._row:
+                    if point.marked_dead:
                         if color is None:
-                            color = self.board[i][j].color
-                        elif color is not self.board[i][j].color:
+                            color = point.color
+                        elif color is not point.color:
                             raise RuntimeError(
                                 "More than one color of stones at a time is currently"
                                 " marked dead, which should never happen"
                             )
-                        self.board[i][j].marked_dead = False
+                        point.marked_dead = False
                         if not just_count:
-                            self.board[i][j].color = None
+                            point.color = None
                         num_marked += 1
 
             if not num_marked:
@@ -685,25 +866,39 @@ class Game(JsonifyableBase):
         # and mark the points as such. Otherwise (zero or two border colors),
         # we mark the group as neutral and assign no points
 
-        for i in range(self.board.size):
-            for j in range(self.board.size):
+        size = self.board.size
+        # which empty points have been collected into a group, indexed by
+        # i * size + j. each belongs to exactly one group, so one map serves the
+        # whole scan, and a byte lookup is much cheaper than hashing a tuple.
+        # stones on the border needn't be tracked at all, as adding their
+        # color again is harmless
+        in_group = bytearray(size * size)
+        neighbors = _neighbors(size)
+        for i in range(size):
+            for j in range(size):
                 if self.board[i][j].color is None and not self.board[i][j].counted:
                     stack = [(i, j)]
-                    colors = set()
-                    group = set()
-                    border = set()
+                    # the colors seen on the border, without allocating a set
+                    # for what is at most two of them
+                    border_white = border_black = False
+                    group = []
                     while stack:
                         ii, jj = stack.pop()
-                        if (ii, jj) in group | border:
+                        if in_group[ii * size + jj]:
                             continue
                         color = self.board[ii][jj].color
                         if color is None:
-                            group.add((ii, jj))
-                            stack.extend(self._adjacencies(ii, jj))
+                            in_group[ii * size + jj] = 1
+                            group.append((ii, jj))
+                            stack.extend(neighbors[ii][jj])
+                        elif color is Color.white:
+                            border_white = True
                         else:
-                            border.add((ii, jj))
-                            colors.add(color)
-                    counts_for = colors.pop() if len(colors) == 1 else None
+                            border_black = True
+                    if border_white is border_black:
+                        counts_for = None
+                    else:
+                        counts_for = Color.white if border_white else Color.black
                     for ii, jj in group:
                         self.board[ii][jj].counted = True
                         self.board[ii][jj].counts_for = counts_for
@@ -716,16 +911,13 @@ class Game(JsonifyableBase):
         assert self.pending_request is not None
         assert self.pending_request.initiator is not action.color
 
-        if self.pending_request.request_type is RequestType.mark_dead:
-            response_string = self._respond_mark_dead(action)
-        elif self.pending_request.request_type is RequestType.draw:
-            response_string = self._respond_draw(action)
-        elif self.pending_request.request_type is RequestType.tally_score:
-            response_string = self._respond_draw_tally_score(action)
-        else:
+        try:
+            handler = _RESPONSE_HANDLERS[self.pending_request.request_type]
+        except KeyError:
             raise RuntimeError(
                 f"Unknown RequestType encountered: {self.pending_request.request_type}"
-            )
+            ) from None
+        response_string = handler(self, action)
 
         self.pending_request = None
         return (
@@ -741,16 +933,6 @@ class Game(JsonifyableBase):
             ),
         )
 
-    def _adjacencies(self, i: int, j: int) -> Set[Tuple[int, int]]:
-        """Utility to return the set of in bounds points adjacent to (i, j)
-        given self.board"""
-
-        return {
-            (ii, jj)
-            for ii, jj in ((i - 1, j), (i + 1, j), (i, j - 1), (i, j + 1))
-            if 0 <= ii < self.board.size and 0 <= jj < self.board.size
-        }
-
     def _gather(
         self, i: int, j: int, board: Board = None
     ) -> Tuple[Set[Tuple[int, int]], bool]:
@@ -768,15 +950,21 @@ class Game(JsonifyableBase):
         group = {(i, j)}
         stack = [(i, j)]
         alive = False
+        neighbors = _neighbors(board.size)
 
+        # this is the innermost loop of placing a stone, so neighbors are
+        # looked up rather than bounds checked, and membership in the group is
+        # tested inline
         while stack:
-            adjacencies = self._adjacencies(*stack.pop()) - group
-            alive = alive or any(board[ii][jj].color is None for ii, jj in adjacencies)
-            to_add = [
-                (ii, jj) for ii, jj in adjacencies if board[ii][jj].color is color
-            ]
-            group.update(to_add)
-            stack.extend(to_add)
+            i, j = stack.pop()
+            for ii, jj in neighbors[i][j]:
+                if (ii, jj) not in group:
+                    neighbor_color = board[ii][jj].color
+                    if neighbor_color is None:
+                        alive = True
+                    elif neighbor_color is color:
+                        group.add((ii, jj))
+                        stack.append((ii, jj))
 
         return (group, alive)
 
@@ -887,4 +1075,24 @@ class Game(JsonifyableBase):
                 )
             )
         self._prev_board = None
+        self._pickle_cache = None
         return self
+
+
+# the method handling each type of action and response, looked up rather than
+# tested for in turn by `Game.take_action` and `Game._respond`
+_ACTION_HANDLERS: Dict[ActionType, Callable[[Game, Action], Tuple[bool, str]]] = {
+    ActionType.place_stone: Game._place_stone,
+    ActionType.pass_turn: Game._pass_turn,
+    ActionType.resign: Game._resign,
+    ActionType.mark_dead: Game._mark_dead,
+    ActionType.request_draw: Game._request_draw,
+    ActionType.request_tally_score: Game._request_tally_score,
+    ActionType.accept: Game._respond,
+    ActionType.reject: Game._respond,
+}
+_RESPONSE_HANDLERS: Dict[RequestType, Callable[[Game, Action], str]] = {
+    RequestType.mark_dead: Game._respond_mark_dead,
+    RequestType.draw: Game._respond_draw,
+    RequestType.tally_score: Game._respond_draw_tally_score,
+}
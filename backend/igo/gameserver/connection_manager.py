@@ -60,7 +60,9 @@ class IgoWebSocket(tornado.websocket.WebSocketHandler):
         preempted with the default logger settings
         """
 
-        cls.game_manager: GameManager = await GameManager(os.environ["DATABASE_URL"])
+        cls.game_manager: GameManager = await GameManager.create(
+            os.environ["DATABASE_URL"]
+        )
         match_expr = (
             f"{'' if origin_suffix.startswith('^') else '.*'}{origin_suffix}(:\d+)?$"
         )
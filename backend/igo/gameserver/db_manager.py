@@ -1,6 +1,8 @@
+from __future__ import annotations
 from .containers import KeyContainer
 import string
-from collections import defaultdict
+from collections import defaultdict, deque
+from functools import lru_cache, partial
 from enum import Enum, auto
 from .constants import KEY_LEN
 from igo.game import Color, Game
@@ -9,16 +11,18 @@ from typing import (
     Callable,
     Coroutine,
     DefaultDict,
+    Deque,
+    Dict,
     List,
     Set,
     Tuple,
     Optional,
 )
-from asyncinit import asyncinit
 import asyncpg
-from uuid import uuid4
+import secrets
 from hashlib import sha256
 import asyncio
+import base64
 import pickle
 import logging
 import aiofiles
@@ -44,19 +48,68 @@ class _UpdateType(Enum):
     opponent_connected = auto()
 
 
+# the update type name with which trigger_update_all notifies, standing in for a
+# forced update of every _UpdateType
+_UPDATE_ALL = "all"
+
+
 # there are several places where we cannot accept a failed database action and
 # must instead retry in a loop. this is the length of time, in seconds, that we
 # sleep in between failures
 DB_UNAVAILABLE_SLEEP_PERIOD = 2
+# the number of times that writing a new game is attempted, generating fresh
+# keys each time, before giving up on key collisions
+NEW_GAME_KEY_ATTEMPTS = 3
+# the maximum number of connections in the pool (asyncpg's default, made explicit
+# here because it is also used to size other things)
+POOL_MAX_SIZE = 10
+# the number of connections opened up front. asyncpg connects this many while
+# creating the pool, so keeping it at POOL_MAX_SIZE means no acquire ever waits on
+# a new connection
+POOL_MIN_SIZE = POOL_MAX_SIZE
+# the maximum number of player keys whose updates are consumed concurrently. kept
+# well under POOL_MAX_SIZE so that a flood of updates can't starve the listener
+# connection or client requests of pool connections
+MAX_CONCURRENT_UPDATES = POOL_MAX_SIZE // 2
+# the maximum number of updates waiting to be consumed. see `_enqueue_update`
+# for what happens to any beyond that
+UPDATE_QUEUE_MAX_SIZE = 1024
+# all queries issued by DbManager. asyncpg caches prepared statements per
+# connection keyed on query text, so keeping each query in one place also
+# guarantees that every call site hits the same cache entry. each is a single
+# statement and so already atomic. only wrap one in an explicit transaction when
+# something else, e.g. subscribing to updates, must succeed or fail with it
+_SQL_DO_CLEANUP = "CALL do_cleanup($1);"
+_SQL_NEW_GAME = "CALL new_game($1, $2, $3, $4, $5, $6, $7, $8);"
+_SQL_JOIN_GAME = "SELECT * FROM join_game($1, $2, $3, $4);"
+_SQL_TRIGGER_UPDATE_ALL = "CALL trigger_update_all($1);"
+_SQL_GET_GAME_STATUS = (
+    "SELECT game_data, time_played, version FROM get_game_status($1);"
+)
+_SQL_GET_CHAT_UPDATES = "SELECT * FROM get_chat_updates($1, $2, $3);"
+_SQL_GET_OPPONENT_CONNECTED = "SELECT * FROM get_opponent_connected($1);"
+_SQL_WRITE_GAME = "SELECT * FROM write_game($1, $2, $3);"
+_SQL_WRITE_CHAT = "SELECT * FROM write_chat($1, $2, $3);"
+_SQL_UNSUBSCRIBE = "SELECT * FROM unsubscribe($1, $2);"
+# plain dict lookups in place of the comparatively slow Color[name] and
+# JoinResult[name]
+_COLORS_BY_NAME = {c.name: c for c in Color}
+_JOIN_RESULTS_BY_NAME = {r.name: r for r in JoinResult}
 ALPHANUM_CHARS = "".join(str(x) for x in range(10)) + string.ascii_letters
+_ALPHANUM_BYTES = ALPHANUM_CHARS.encode()
+# every pair of base 62 digits, least significant first, indexed by their value
+# times two. lets alphanum_uuid produce two chars per bigint division
+_ALPHANUM_PAIRS = bytes(
+    b for hi in _ALPHANUM_BYTES for lo in _ALPHANUM_BYTES for b in (lo, hi)
+)
 
 
 def alphanum_uuid(desired_length: int = KEY_LEN) -> str:
     """
     Produce a alpha-numeric uuid (each char in [0-9a-zA-Z], i.e. base 62) of
-    `desired_length` using uuid4 under the hood. As uuid4 is 128 bits long,
-    possible values range between 0 and 2**128 = 7N42dgm5tFLK9N8MT7fHC8 in base
-    62, so `desired_length` must be <= 22 (and at least 1).
+    `desired_length` using 128 random bits from `secrets` under the hood. As
+    such, possible values range between 0 and 2**128 = 7N42dgm5tFLK9N8MT7fHC8
+    in base 62, so `desired_length` must be <= 22 (and at least 1).
 
     In the context of game ids, choosing a large base means that we can have
     short, easy to type keys while still maintaining a practically zero
@@ -67,69 +120,118 @@ def alphanum_uuid(desired_length: int = KEY_LEN) -> str:
     1 billion games. Obviously this is a hobby project and will never be played
     at that scale, but a real-world game could be, so this is a legitimate
     concern, unless we wanted to do something about handling collisions
-    (currently, we assume it never happens and simply blow up if it does)
+    (currently, `DbManager.write_new_game` regenerates keys a few times and
+    then simply blows up if collisions persist)
     """
 
     assert isinstance(desired_length, int) and 0 < desired_length <= 22
 
-    base_10 = uuid4().int
-    res = ""
-    while base_10 and desired_length:
-        res += ALPHANUM_CHARS[base_10 % 62]
-        desired_length -= 1
-        base_10 //= 62
+    # uuid4 would also do, but it builds a whole UUID object (and fixes 6 of
+    # the bits) just for us to throw it away
+    base_10 = int.from_bytes(secrets.token_bytes(16), "big")
+    res = bytearray()
     # the fact that this is backwards is immaterial in the context of generating
     # a unique id, so we choose not to reverse it
-    return res
+    while len(res) < desired_length:
+        base_10, digits = divmod(base_10, 62 * 62)
+        res += _ALPHANUM_PAIRS[2 * digits : 2 * digits + 2]
+        if not base_10:
+            # we've run out of digits. a leading zero isn't one of them
+            if digits < 62:
+                del res[-1]
+            break
+    return res[:desired_length].decode()
+
+
+class _NoResetConnection(asyncpg.Connection):
+    """
+    Pool connection class which skips asyncpg's reset query (`UNLISTEN *`,
+    `RESET ALL`, etc.), otherwise issued every time a connection is released
+    back to the pool. Pool connections here are only used to call our own
+    functions and procedures, never to set session state, and all LISTENs live
+    on the dedicated listener connection, which is never released, so the reset
+    is a wasted round trip. Note that asyncpg still issues a ROLLBACK on release
+    if a transaction was somehow left open
+    """
+
+    def _get_reset_query(self) -> str:
+        return ""
+
+    # asyncpg >= 0.30 made this a public override point under a new name
+    get_reset_query = _get_reset_query
+
+
+@lru_cache(maxsize=1)
+def _get_machine_id() -> str:
+    """
+    machine-id is a reboot persistent unique identifier that should not be
+    shared externally. Return a hash of it which mimics
+    sd_id128_get_machine_app_specific(). As it can't change over the lifetime of
+    the process, the file is only read once
+    """
+
+    with open("/etc/machine-id", "rb") as r:
+        return sha256(r.readline().strip()).hexdigest()
 
 
-@asyncinit
 class DbManager:
     __slots__ = (
         "_listener_connection",
-        "_listening_channels",
-        "_listener_lock",
+        "_update_channel",
+        "_subscribed_keys",
+        "_last_version",
+        "_last_chat_id",
         "_connection_pool",
         "_machine_id",
         "_update_queue",
+        "_update_overflow",
+        "_chat_overflow",
+        "_overflowed_updates",
+        "_update_semaphore",
+        "_update_tasks",
+        "_pending_updates",
+        "_update_batch_tasks",
+        "_update_consumers",
         "_game_status_callback",
         "_chat_callback",
         "_opponent_connected_callback",
     )
 
-    async def __init__(
-        self,
+    @classmethod
+    async def create(
+        cls,
         game_status_callback: Callable[[str, Game], Coroutine],
         chat_callback: Callable[[str, ChatThread], Coroutine],
         opponent_connected_callback: Callable[[str, bool], Coroutine],
         dsn: str = "postgres://postgres@localhost/test",
         do_setup: bool = False,
-    ) -> None:
+    ) -> DbManager:
         """
-        Interface to the postgres database store. Responsibilities include:
+        Create and return a ready-to-use interface to the postgres database
+        store. As set up requires awaiting the database, use this in place of
+        the constructor. Responsibilities include:
 
         - On start up, cleaning the player key table in case of reboot while
           managing any connections
         - Handling new game creation
         - Handling joining a connected player to an existing game
-        - Subscribing to and registering callbacks for various update channels
+        - Subscribing to updates for the player keys it manages
         - Issuing game updates to the database and reporting success or failure
         - Issuing chat messages to the database
-        - Unsubscribing from update channels and cleaning up
+        - Unsubscribing from updates and cleaning up
 
         :param Callable[[str, Game], Coroutine] game_status_callback: an async
-        callback to be invoked when a notification is received on a game status
-        channel. must take a player key string and a Game object as arguments
+        callback to be invoked when a game status update is received. must take
+        a player key string and a Game object as arguments
 
         :param Callable[[str, ChatThread], Coroutine] chat_callback: an async
-        callback to be invoked when a notification is received on a chat
-        channel. must take a player key string and a ChatThread object as
-        arguments
+        callback to be invoked when a chat update is received. must take a
+        player key string and a ChatThread object as arguments
 
         :param Callable[[str, bool], Coroutine] opponent_connected_callback: an
-        async callback to be invoked when a notification is received on an
-        opponent connected channel. must take a player key string and a bool
-        indicator of connectedness as arguments
+        async callback to be invoked when an opponent connected update is
+        received. must take a player key string and a bool indicator of
+        connectedness as arguments
 
         :param str dsn: data source name url
 
@@ -137,49 +239,77 @@ class DbManager:
         creation scripts as if using a fresh database. useful for testing
         """
 
+        self: DbManager = cls.__new__(cls)
+        await self._async_init(
+            game_status_callback,
+            chat_callback,
+            opponent_connected_callback,
+            dsn,
+            do_setup,
+        )
+        return self
+
+    async def _async_init(
+        self,
+        game_status_callback: Callable[[str, Game], Coroutine],
+        chat_callback: Callable[[str, ChatThread], Coroutine],
+        opponent_connected_callback: Callable[[str, bool], Coroutine],
+        dsn: str,
+        do_setup: bool,
+    ) -> None:
+        """
+        The actual meat of `create`. See its documentation for details
+        """
+
         self._game_status_callback = game_status_callback
         self._chat_callback = chat_callback
         self._opponent_connected_callback = opponent_connected_callback
 
-        self._connection_pool: asyncpg.pool.Pool = await asyncpg.create_pool(dsn)
-        self._listener_connection: asyncpg.Connection = await self._get_listener()
-        # { player_key: [(channel, callback), ...], ...}
-        # populate whenever adding listeners and lookup/delete record when
-        # unlistening
-        self._listening_channels: DefaultDict[
-            str, List[Tuple[str, Callable]]
-        ] = defaultdict(list)
-        # since the listener connection is not acquired from the pool before
-        # every use, we need to make sure that we don't try to use it for
-        # multiple operations simultaneously (asyncpg does not provide any
-        # waiting mechanism and will instead throw an exception if we do).
-        # acquire this lock before using _listener_connection, and also to
-        # retain exclusive access to _listening_channels while awaiting db
-        # operations
-        self._listener_lock: asyncio.Lock = asyncio.Lock()
-
-        # machine-id is a reboot persistent unique identifier that should not be
-        # shared externally. the following mimics sd_id128_get_machine_app_specific()
-        async with aiofiles.open("/etc/machine-id", "rb") as r:
-            self._machine_id = sha256((await r.readline()).strip()).hexdigest()
+        # asyncpg closes connections idle for longer than five minutes by default,
+        # which leaves a quiet server to reconnect (and reprepare every statement)
+        # on its next burst of activity. keep them open instead
+        create_pool = asyncpg.create_pool(
+            dsn,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=0,
+            connection_class=_NoResetConnection,
+        )
+        self._connection_pool: asyncpg.pool.Pool
+        if do_setup:
+            # reading the setup scripts doesn't need the pool, so do it while
+            # the pool connects
+            setup_sql: str
+            self._connection_pool, setup_sql = await asyncio.gather(
+                create_pool, self._read_setup_scripts()
+            )
+        else:
+            self._connection_pool = await create_pool
+        # a single tiny read, once per process, so not worth an executor hop
+        self._machine_id = _get_machine_id()
+        # updates for every key we manage arrive on this one channel (see the
+        # notify_update db function), so subscribing to a key needs no LISTEN
+        self._update_channel = f"updates_{self._machine_id[:32]}"
+        # the player keys whose updates we want. notifications for any other
+        # key, e.g. one that was just unsubscribed, are ignored
+        self._subscribed_keys: Set[str] = set()
+        # the version of the game last fetched for each subscribed player key.
+        # game status notifications carry the version that was written, so any
+        # which aren't newer than this can be dropped without a fetch. an empty
+        # payload always forces one
+        self._last_version: Dict[str, int] = {}
+        # the id of the last chat message delivered for each subscribed player
+        # key, set only once the full thread has been. the callback's recipient
+        # keeps the thread itself, so requests for the full thread, e.g. after
+        # a reconnect, need only fetch what it doesn't already have
+        self._last_chat_id: Dict[str, int] = {}
 
         if do_setup:
             try:
-                # NOTE: tables must be executed first. otherwise, it would be
-                # sufficient to list the directory and execute each file
                 conn: asyncpg.Connection
                 async with self._connection_pool.acquire() as conn:
                     async with conn.transaction():
-                        for fn in (
-                            "tables",
-                            "indices",
-                            "views",
-                            "procedures",
-                            "functions",
-                        ):
-                            async with aiofiles.open(f"./sql/{fn}.sql", "r") as r:
-                                sql = await r.read()
-                            await conn.execute(sql)
+                        await conn.execute(setup_sql)
 
             except Exception as e:
                 raise Exception("Failed to run db setup scripts") from e
@@ -198,26 +328,77 @@ class DbManager:
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
-                async with conn.transaction():
-                    await conn.execute(
-                        """
-                        CALL do_cleanup($1);
-                        """,
-                        self._machine_id,
-                    )
+                await conn.execute(
+                    _SQL_DO_CLEANUP,
+                    self._machine_id,
+                )
 
         except Exception as e:
             raise Exception("Failed to execute restart database cleanup") from e
 
         # set up the notifications queue and consumer
-        self._update_queue = asyncio.Queue()
+        self._update_queue = asyncio.Queue(maxsize=UPDATE_QUEUE_MAX_SIZE)
+        # the latest payload of each non-chat update which didn't fit in the
+        # queue, keyed on (update type, player key) and so bounded by the number
+        # of subscribed keys. folded into the next batch by _update_consumer
+        self._update_overflow: Dict[Tuple[_UpdateType, str], str] = {}
+        # chat updates which didn't fit, as (player key, payload), in the order
+        # they arrived. each message must be delivered, so these can't be
+        # collapsed, but they are drained alongside the overflow above
+        self._chat_overflow: Deque[Tuple[str, str]] = deque()
+        self._overflowed_updates = 0
+        self._update_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPDATES)
+        # the latest task dispatching updates for each player key, which the
+        # next one for that key waits on
+        self._update_tasks: Dict[str, asyncio.Task] = {}
+        # the updates of any such task which is still waiting on the previous
+        # one, and which can therefore still be added to
+        self._pending_updates: Dict[str, List[Tuple[_UpdateType, str]]] = {}
+        # tasks marking each batch done once it has been dispatched, which the
+        # event loop itself only holds weakly
+        self._update_batch_tasks: Set[asyncio.Task] = set()
+        # type-specific consumers, all taking (player key, payload)
+        self._update_consumers: Dict[_UpdateType, Callable[[str, str], Coroutine]] = {
+            _UpdateType.game_status: self._game_status_consumer,
+            _UpdateType.chat: self._chat_consumer,
+            _UpdateType.opponent_connected: self._opponent_connected_consumer,
+        }
         asyncio.create_task(self._update_consumer())
+        # only start listening once there is somewhere to put updates
+        self._listener_connection: asyncpg.Connection = await self._get_listener()
+
+    @staticmethod
+    async def _read_setup_scripts() -> str:
+        """
+        Return the contents of all db setup scripts, joined in the order in
+        which they must be executed
+        """
+
+        async def read(name: str) -> str:
+            async with aiofiles.open(f"./sql/{name}.sql", "r") as r:
+                return await r.read()
+
+        try:
+            # NOTE: tables must be executed first. otherwise, it would be
+            # sufficient to list the directory and execute each file. the files
+            # are read concurrently (gather preserves order) so that they can be
+            # executed in a single round trip
+            scripts: List[str] = await asyncio.gather(
+                *(
+                    read(fn)
+                    for fn in ("tables", "indices", "views", "procedures", "functions")
+                )
+            )
+
+        except Exception as e:
+            raise Exception("Failed to read db setup scripts") from e
+
+        return "\n".join(scripts)
 
     async def _get_listener(self) -> asyncpg.Connection:
         """
-        Acquire a dedicated pub/sub connection from the pool. It should be used
-        only for (un)listening to notification channels, i.e. asyncpg's
-        (add|remove)_listener. As noted at
+        Acquire a dedicated pub/sub connection from the pool and listen on our
+        update channel. It should be used for nothing else. As noted at
         https://github.com/MagicStack/asyncpg/issues/421, asyncpg will only
         attempt to reconnect pool connections "as long as that is possible to do
         using the original connection parameters." As such, we also need to
@@ -226,6 +407,11 @@ class DbManager:
         """
 
         conn: asyncpg.Connection = await self._connection_pool.acquire()
+        try:
+            await conn.add_listener(self._update_channel, self._on_notify)
+        except:
+            await self._connection_pool.release(conn)
+            raise
         conn.add_termination_listener(
             lambda _: asyncio.create_task(self._reconnect_listener())
         )
@@ -234,10 +420,10 @@ class DbManager:
     async def _reconnect_listener(self) -> None:
         """
         If the db or our connection to it should go down, we will need to
-        reacquire a listener from the pool, resubscribe to all previously subbed
-        channels, and trigger updates for all such channels to get clients
-        updated to the latest state. This should be registered as a termination
-        listener on the listener connect *everytime* one is acquired
+        reacquire a listener from the pool and trigger updates for all
+        subscribed keys to get clients updated to the latest state. This should
+        be registered as a termination listener on the listener connect
+        *everytime* one is acquired
         """
 
         logging.error("Listener connection lost. Attempting to reacquire...")
@@ -256,18 +442,14 @@ class DbManager:
 
         logging.info("Successfully reacquired listener connection")
 
-        try:
-            async with self._listener_lock:
-                for player_key, channels in self._listening_channels.items():
-                    for channel, callback in channels:
-                        await self._listener_connection.add_listener(channel, callback)
-                    await self.trigger_update_all(player_key)
-
-        except Exception as e:
-            raise Exception("Failed to resubscribe and update all clients") from e
-
-        else:
-            logging.info("Successfully resubscribed and updated all clients")
+        # anything published while we weren't listening was missed, so force
+        # every update for every subscribed key. we already know which keys
+        # those are, so rather than round tripping through trigger_update_all
+        # for each, queue the updates directly. the consumer coalesces them with
+        # anything else arriving meanwhile
+        for player_key in self._subscribed_keys:
+            self._enqueue_update_all(player_key)
+        logging.info("Successfully triggered updates for all clients")
 
     async def write_new_game(
         self,
@@ -282,56 +464,46 @@ class DbManager:
         specify `player_color` to start managing that color, optionally specify
         `key_to_unsubscribe` to transactionally unsubscribe from another key,
         and optionally specify one or both `ai_colors` to generate AI secrets
-        for those keys
+        for those keys.
+
+        In the vanishingly unlikely event that the generated keys collide with
+        existing ones, fresh keys are generated and the write is retried up to
+        `NEW_GAME_KEY_ATTEMPTS` times in total
         """
 
-        key_w, key_b = [alphanum_uuid() for _ in range(2)]
-        ai_secret_w = (
-            alphanum_uuid() if ai_colors and Color.white in ai_colors else None
-        )
-        ai_secret_b = (
-            alphanum_uuid() if ai_colors and Color.black in ai_colors else None
-        )
-        keys = KeyContainer(key_w, key_b, ai_secret_w, ai_secret_b)
+        # see write_game for why this happens off of the event loop
+        game_data = await asyncio.get_running_loop().run_in_executor(None, game.pickled)
 
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
-                async with conn.transaction():
-                    await conn.execute(
-                        """
-                        CALL new_game($1, $2, $3, $4, $5, $6, $7, $8);
-                        """,
-                        pickle.dumps(game),
-                        key_w,
-                        key_b,
-                        player_color.name if player_color else None,
-                        self._machine_id,
-                        key_to_unsubscribe,
-                        ai_secret_w,
-                        ai_secret_b,
+                for attempt in range(1, NEW_GAME_KEY_ATTEMPTS + 1):
+                    keys = KeyContainer(
+                        alphanum_uuid(),
+                        alphanum_uuid(),
+                        alphanum_uuid()
+                        if ai_colors and Color.white in ai_colors
+                        else None,
+                        alphanum_uuid()
+                        if ai_colors and Color.black in ai_colors
+                        else None,
                     )
 
-                    # there's a miniscule chance, but one we could artificially
-                    # force, that the new game is created and then someone joins
-                    # it on the other key before we are subscribed to our key's
-                    # update channels. as they use separate connections, we
-                    # can't make these things truly transactional without a two
-                    # stage commit, which seems like overkill. however, we can
-                    # subscribe to updates before committing the new game
-                    # transaction, which ensures that no one can join the new
-                    # game before we are safely subscribed to all the necessary
-                    # update channels.
-                    #
-                    # the one small caveat that we can't weasle out of without a
-                    # two stage commit is that we could successfully subscribe
-                    # and then fail to commit the new game transaction, which
-                    # leaves us with unused subscriptions, a memory leak, and
-                    # warnings everytime the update callbacks get invoked since
-                    # game_manager state will not contain the relevant player
-                    # keys
-                    if player_color:
-                        await self._subscribe_to_updates(keys[player_color].player_key)
+                    try:
+                        await self._write_new_game_transaction(
+                            conn, game_data, keys, player_color, key_to_unsubscribe
+                        )
+
+                    except asyncpg.UniqueViolationError:
+                        if attempt == NEW_GAME_KEY_ATTEMPTS:
+                            raise
+                        logging.warning(
+                            f"New game keys {keys} collided with existing keys."
+                            " Regenerating and trying again"
+                        )
+
+                    else:
+                        break
 
         except Exception as e:
             raise Exception("Failed to write new game") from e
@@ -340,6 +512,57 @@ class DbManager:
             logging.info(f"Successfully wrote new game with keys {keys} to database")
             return keys
 
+    async def _write_new_game_transaction(
+        self,
+        conn: asyncpg.Connection,
+        game_data: bytes,
+        keys: KeyContainer,
+        player_color: Optional[Color],
+        key_to_unsubscribe: Optional[str],
+    ) -> None:
+        """
+        Make a single attempt at the work of `write_new_game` inside of its own
+        transaction on `conn`. Raises `asyncpg.UniqueViolationError` if `keys`
+        collide with existing keys, in which case the transaction is rolled
+        back and no subscriptions are made
+        """
+
+        player_key = keys[player_color].player_key if player_color else None
+        unsubscribed = False
+        try:
+            async with conn.transaction():
+                await conn.execute(
+                    _SQL_NEW_GAME,
+                    game_data,
+                    keys[Color.white].player_key,
+                    keys[Color.black].player_key,
+                    player_color.name if player_color else None,
+                    self._machine_id,
+                    key_to_unsubscribe,
+                    keys[Color.white].ai_secret,
+                    keys[Color.black].ai_secret,
+                )
+
+                # there's a miniscule chance, but one we could artificially
+                # force, that the new game is created and then someone joins it
+                # on the other key before we are subscribed to our key's
+                # updates. subscribing before committing the new game
+                # transaction ensures that we never miss one
+                if player_key:
+                    self._subscribe_to_updates(player_key)
+                # likewise, stop accepting updates for the key being left
+                # before committing (see join_game)
+                unsubscribed = self._unsubscribe_from_updates(key_to_unsubscribe)
+
+        except:
+            # the transaction was rolled back, so we aren't managing the key
+            # after all, but are still managing the one we meant to leave
+            if player_key:
+                self._subscribed_keys.discard(player_key)
+            if unsubscribed:
+                self._subscribed_keys.add(key_to_unsubscribe)
+            raise
+
     async def join_game(
         self,
         player_key: str,
@@ -359,38 +582,43 @@ class DbManager:
         set up any necessary state to allow update callbacks to succeed
         """
 
+        subscribed = unsubscribed = False
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
                 async with conn.transaction():
                     res, key_w, ai_secret_w, key_b, ai_secret_b = await conn.fetchrow(
-                        """
-                        SELECT * FROM join_game($1, $2, $3, $4);
-                        """,
+                        _SQL_JOIN_GAME,
                         player_key,
                         self._machine_id,
                         key_to_unsubscribe,
                         ai_secret,
                     )
 
-                    # similar to new game, while we should ideally be doing a
-                    # two stage commit to ensure that join and subscribe happen
-                    # transactionally, it's very close to as good to just
-                    # subscribe inside of the join transaction *block*, ensuring
-                    # that if subscription fails, so does join.
-                    #
-                    # also as with new game, there's an even tinier chance that
-                    # right at the end the join transaction cannot be committed,
-                    # which leaves us subscribed to channels for a key we aren't
-                    # actually joined to and all attendant problems
-                    res = JoinResult[res]
+                    # as with new game, subscribe before committing so that no
+                    # update can be missed
+                    res = _JOIN_RESULTS_BY_NAME[res]
                     if res is JoinResult.success:
                         keys = KeyContainer(key_w, key_b, ai_secret_w, ai_secret_b)
-                        await self._subscribe_to_updates(player_key)
+                        self._subscribe_to_updates(player_key)
+                        subscribed = True
+                        # and stop accepting updates for the key being left,
+                        # so that none arriving once this commits, e.g. the
+                        # opponent connected notification this join sends its
+                        # opponent, reaches a client which has moved on
+                        unsubscribed = self._unsubscribe_from_updates(
+                            key_to_unsubscribe
+                        )
                     else:
                         keys = None
 
         except Exception as e:
+            # the transaction was rolled back, so we aren't managing the key
+            # after all, but are still managing the one we meant to leave
+            if subscribed:
+                self._subscribed_keys.discard(player_key)
+            if unsubscribed:
+                self._subscribed_keys.add(key_to_unsubscribe)
             raise Exception(f"Failed to join game with key {player_key}") from e
 
         else:
@@ -401,121 +629,365 @@ class DbManager:
 
     async def trigger_update_all(self, player_key: str) -> None:
         """
-        Trigger a notification on all channels associated with `player_key`
+        Trigger a notification for every update type associated with
+        `player_key`
         """
 
+        if player_key in self._subscribed_keys:
+            # we manage the key, so the notification would only come back to us.
+            # skip the round trip and queue the updates directly
+            self._enqueue_update_all(player_key)
+            return
+
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
-                async with conn.transaction():
-                    await conn.execute(
-                        """
-                        CALL trigger_update_all($1);
-                        """,
-                        player_key,
-                    )
+                await conn.execute(
+                    _SQL_TRIGGER_UPDATE_ALL,
+                    player_key,
+                )
 
         except Exception as e:
             raise Exception(
                 f"Failed to trigger update all for player key {player_key}"
             ) from e
 
-    async def _subscribe_to_updates(self, player_key: str) -> None:
+    def _subscribe_to_updates(self, player_key: str) -> None:
         """
-        Subscribe to the update channels corresponding to `player_key` and
-        register callbacks to receive updates. Should be called only after
-        successfully creating or joining a game
+        Start accepting updates for `player_key` from our update channel.
+        Should be called only while creating or joining a game, before the
+        transaction that makes us its manager commits
         """
 
-        def listener_callback(update_type: _UpdateType):
-            return lambda _, _1, _2, payload: self._update_queue.put_nowait(
-                (update_type, player_key, payload)
+        self._subscribed_keys.add(player_key)
+        logging.info(f"Successfully subscribed to status updates for {player_key}")
+
+    def _unsubscribe_from_updates(self, player_key: Optional[str]) -> bool:
+        """
+        Counterpart to `_subscribe_to_updates` for the key being left, if any,
+        when creating or joining a game. Return whether we were subscribed to
+        it, so that the caller can resubscribe should its transaction roll back.
+        `unsubscribe` does the rest of the cleanup once it has committed
+        """
+
+        if player_key not in self._subscribed_keys:
+            return False
+        self._subscribed_keys.discard(player_key)
+        return True
+
+    def _on_notify(
+        self,
+        connection: asyncpg.Connection,
+        pid: int,
+        channel: str,
+        payload: str,
+    ) -> None:
+        """
+        The listener callback for our update channel. Payloads are
+        `{update_type.name} {player_key} {update payload}`, where the update
+        payload may be empty, but neither of the others ever contain spaces.
+        The update type name may also be `_UPDATE_ALL`
+        """
+
+        update_type_name, player_key, update_payload = payload.split(" ", 2)
+        if player_key not in self._subscribed_keys:
+            return
+        if update_type_name == _UPDATE_ALL:
+            self._enqueue_update_all(player_key)
+        else:
+            self._enqueue_update(
+                _UpdateType[update_type_name], player_key, update_payload
             )
 
-        subscriptions = [
-            (f"{update_type.name}_{player_key}", listener_callback(update_type))
-            for update_type in _UpdateType
-        ]
+    def _enqueue_update_all(self, player_key: str) -> None:
+        """
+        Queue a forced update of every type for `player_key`
+        """
 
-        async with self._listener_lock:
-            try:
-                async with self._listener_connection.transaction():
-                    for channel, partial_callback in subscriptions:
-                        await self._listener_connection.add_listener(
-                            channel, partial_callback
-                        )
+        for update_type in _UpdateType:
+            self._enqueue_update(update_type, player_key, "")
 
-            except Exception as e:
-                raise Exception(
-                    f"Failed to subscribe to status updates for player key {player_key}"
-                ) from e
+    def _enqueue_update(
+        self, update_type: _UpdateType, player_key: str, payload: str
+    ) -> None:
+        """
+        Queue an update for `_update_consumer`, whether it arrived as a
+        notification or was synthesized locally
+        """
 
-            else:
-                # in order to ensure that our internal state doesn't become
-                # inconsistent, only alter it after the above transaction has
-                # successfully completed
-                self._listening_channels[player_key].extend(subscriptions)
-                logging.info(
-                    f"Successfully subscribed to status updates for {player_key}"
-                )
+        # chat messages must be delivered in order, so once any have
+        # overflowed, later ones follow them rather than taking a queue slot
+        # freed up in the meantime
+        if update_type is _UpdateType.chat and self._chat_overflow:
+            self._overflowed_updates += 1
+            self._chat_overflow.append((player_key, payload))
+            return
+
+        try:
+            self._update_queue.put_nowait((update_type, player_key, payload))
+
+        except asyncio.QueueFull:
+            # the queue is bounded so that a storm of notifications can't grow
+            # it without limit. chat messages must each be delivered, so they
+            # are kept in order outside of the queue. everything else only
+            # reports the latest state, so we hold on to the latest payload per
+            # key, except that a forced game status fetch is never replaced
+            # (see `_coalesce_updates`)
+            self._overflowed_updates += 1
+            if update_type is _UpdateType.chat:
+                self._chat_overflow.append((player_key, payload))
+            elif not (
+                update_type is _UpdateType.game_status
+                and self._update_overflow.get((update_type, player_key)) == ""
+            ):
+                self._update_overflow[(update_type, player_key)] = payload
+
+    def update_queue_stats(self) -> Dict[str, int]:
+        """
+        Return the number of updates currently queued, as well as the number
+        which have overflowed the queue since startup, for monitoring purposes
+        """
+
+        return {
+            "queued": self._update_queue.qsize()
+            + len(self._update_overflow)
+            + len(self._chat_overflow),
+            "overflowed": self._overflowed_updates,
+        }
 
     async def _update_consumer(self) -> None:
         """
-        The top-level consumer for queued updates. Routes to type-specific
-        consumers
+        The top-level consumer for queued updates. Whenever an update arrives,
+        drains anything else already waiting in the queue, coalesces the lot
+        (see `_coalesce_updates`), and routes the result to type-specific
+        consumers. Updates for any one player key are consumed in order, but
+        those for different keys are consumed concurrently and without waiting
+        on the rest of their batch, so that one slow update doesn't hold up
+        every other client
         """
 
         while True:
-            update_type: _UpdateType
-            player_key: str
-            payload: str
-            update_type, player_key, payload = await self._update_queue.get()
-
-            try:
-                if update_type is _UpdateType.game_status:
-                    await self._game_status_consumer(player_key)
-                elif update_type is _UpdateType.chat:
-                    await self._chat_consumer(player_key, payload)
-                elif update_type is _UpdateType.opponent_connected:
-                    await self._opponent_connected_consumer(player_key, payload)
-                else:
-                    logging.error(f"Found unknown update type {update_type} in queue")
-
-            except AssertionError as e:
-                # this can happen if a player unsubscribes during a period of
-                # database inavailability and the recovery process proceeds in a
-                # certain order. namely, if an update is triggered, e.g. from
-                # within _reconnect_listener, before the listener is removed,
-                # but is processed after the unsub process is complete. this
-                # behavior isn't ideal, so we issue a warning, but it also
-                # appears to be harmless, so we don't blow up completely. fixing
-                # it, at least in the current design, would require a
-                # fine-grained control over async task scheduling that we don't
-                # have and don't particularly want
-                logging.warning(
-                    f"Unable to process update of type {update_type.name} for player"
-                    f"key {player_key}: {e}"
+            updates: List[Tuple[_UpdateType, str, str]] = [
+                await self._update_queue.get()
+            ]
+            while True:
+                try:
+                    updates.append(self._update_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            num_dequeued = len(updates)
+            # anything which overflowed the queue is newer than what was in it.
+            # overflow only ever happens while the queue is full, so this can't
+            # be left waiting for the next update to arrive
+            updates.extend(
+                (update_type, player_key, payload)
+                for (update_type, player_key), payload in self._update_overflow.items()
+            )
+            self._update_overflow.clear()
+            updates.extend(
+                (_UpdateType.chat, player_key, payload)
+                for player_key, payload in self._chat_overflow
+            )
+            self._chat_overflow.clear()
+
+            by_player_key: DefaultDict[
+                str, List[Tuple[_UpdateType, str]]
+            ] = defaultdict(list)
+            for update_type, player_key, payload in self._coalesce_updates(updates):
+                by_player_key[player_key].append((update_type, payload))
+
+            tasks: List[asyncio.Task] = []
+            for player_key, player_key_updates in by_player_key.items():
+                pending = self._pending_updates.get(player_key)
+                if pending is not None:
+                    # the last task for this key hasn't started yet, so rather
+                    # than queueing up another behind it, e.g. another fetch of
+                    # a game status that it will already fetch, fold these
+                    # updates into its own
+                    combined = [
+                        (update_type, player_key, payload)
+                        for update_type, payload in pending + player_key_updates
+                    ]
+                    pending[:] = [
+                        (update_type, payload)
+                        for update_type, _, payload in self._coalesce_updates(combined)
+                    ]
+                    tasks.append(self._update_tasks[player_key])
+                    continue
+
+                # wait for room before taking on more work, so that a flood of
+                # updates backs up into the bounded queue rather than into an
+                # unbounded number of tasks. released by _dispatch_updates
+                await self._update_semaphore.acquire()
+                previous = self._update_tasks.get(player_key)
+                task = asyncio.create_task(
+                    self._dispatch_updates(player_key, player_key_updates, previous)
                 )
+                task.add_done_callback(partial(self._on_updates_dispatched, player_key))
+                self._update_tasks[player_key] = task
+                if previous is not None:
+                    self._pending_updates[player_key] = player_key_updates
+                tasks.append(task)
+
+            batch_task = asyncio.create_task(
+                self._finish_update_batch(tasks, num_dequeued)
+            )
+            self._update_batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self._update_batch_tasks.discard)
+
+    def _on_updates_dispatched(self, player_key: str, task: asyncio.Task) -> None:
+        """
+        Done callback for tasks created by `_update_consumer`
+        """
+
+        if self._update_tasks.get(player_key) is task:
+            del self._update_tasks[player_key]
+            # only if it was cancelled before it could remove this itself
+            self._pending_updates.pop(player_key, None)
+        # an exception here would otherwise go unreported, so we log it. the
+        # next task for the key carries on regardless
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(
+                f"Failed to process updates for player key {player_key}",
+                exc_info=task.exception(),
+            )
+
+    async def _finish_update_batch(
+        self, tasks: List[asyncio.Task], num_dequeued: int
+    ) -> None:
+        """
+        Mark the `num_dequeued` updates of a batch done once all of `tasks`,
+        which dispatch them, are.
+
+        NOTE: as we aren't attempting to join the queue in the current design,
+        this doesn't really do anything useful. that said, it's good practice,
+        because it future-proofs us should we have a reason to join the queue
+        later on
+        """
 
-            # NOTE: as we aren't attempting to join the queue in the current
-            # design, this call doesn't really do anything useful. that said,
-            # it's good practice, because it future-proofs us should we have a
-            # reason to join the queue later on
+        if tasks:
+            await asyncio.wait(tasks)
+        for _ in range(num_dequeued):
             self._update_queue.task_done()
 
-    async def _game_status_consumer(self, player_key: str) -> None:
+    @staticmethod
+    def _coalesce_updates(
+        updates: List[Tuple[_UpdateType, str, str]]
+    ) -> List[Tuple[_UpdateType, str, str]]:
+        """
+        Collapse `updates` into the smallest list of updates which produces the
+        same end result for clients, preserving the order in which each
+        (update type, player key) pair was first seen. Game status and
+        opponent connected consumers only report the latest state, so only the
+        final payload of each is kept, except that an empty game status payload
+        (a forced fetch) is never replaced by a version. Chat payloads identify
+        individual messages, so each distinct one is kept, unless an empty
+        payload (the full thread) was requested, which subsumes them all
+        """
+
+        coalesced: Dict[Tuple[_UpdateType, str], List[str]] = {}
+        for update_type, player_key, payload in updates:
+            payloads = coalesced.setdefault((update_type, player_key), [])
+            if update_type is _UpdateType.game_status and payloads == [""]:
+                continue
+            if update_type is not _UpdateType.chat or not payload:
+                payloads[:] = [payload]
+            elif payloads != [""] and payload not in payloads:
+                payloads.append(payload)
+
+        return [
+            (update_type, player_key, payload)
+            for (update_type, player_key), payloads in coalesced.items()
+            for payload in payloads
+        ]
+
+    async def _dispatch_updates(
+        self,
+        player_key: str,
+        updates: List[Tuple[_UpdateType, str]],
+        previous: Optional[asyncio.Task],
+    ) -> None:
+        """
+        Once `previous`, the task dispatching the last batch of updates for
+        `player_key`, if any, is done, route each of `updates`, a list of
+        (update type, payload) pairs for `player_key`, to its type-specific
+        consumer in turn. The caller must have acquired `_update_semaphore`,
+        which bounds this to `MAX_CONCURRENT_UPDATES` across all player keys,
+        and this releases it
+        """
+
+        try:
+            if previous is not None:
+                # wait, rather than await, so that its failure isn't ours
+                await asyncio.wait((previous,))
+                # from here on, `updates` can no longer be added to
+                del self._pending_updates[player_key]
+            for update_type, payload in updates:
+                await self._dispatch_update(update_type, player_key, payload)
+
+        finally:
+            self._update_semaphore.release()
+
+    async def _dispatch_update(
+        self, update_type: _UpdateType, player_key: str, payload: str
+    ) -> None:
+        """
+        Route a single update to its type-specific consumer
+        """
+
+        consumer = self._update_consumers.get(update_type)
+        if consumer is None:
+            logging.error(f"Found unknown update type {update_type} in queue")
+            return
+
+        try:
+            await consumer(player_key, payload)
+
+        except AssertionError as e:
+            # this can happen if a player unsubscribes after an update for them
+            # was queued, e.g. from within _reconnect_listener, but before it
+            # was processed. this behavior isn't ideal, so we issue a warning,
+            # but it also appears to be harmless, so we don't blow up
+            # completely. fixing it, at least in the current design, would
+            # require a fine-grained control over async task scheduling that we
+            # don't have and don't particularly want
+            logging.warning(
+                f"Unable to process update of type {update_type.name} for player"
+                f"key {player_key}: {e}"
+            )
+
+    async def _game_status_consumer(self, player_key: str, payload: str) -> None:
+        # payloads are empty, which forces a fetch, or the version written,
+        # optionally followed by the time played and the base64 encoded game
+        # data (see the write_game db function)
+        version_text, _, game_status_text = payload.partition(" ")
+        # notify is only ever an optimization: if the version announced isn't
+        # newer than what we already fetched, the client already has it
+        if version_text and int(version_text) <= self._last_version.get(player_key, -1):
+            return
+
         try:
             game_data: bytes
             time_played: float
-            conn: asyncpg.Connection
-            async with self._connection_pool.acquire() as conn:
-                game_data, time_played = await conn.fetchrow(
-                    """
-                    SELECT game_data, time_played FROM get_game_status($1);
-                    """,
-                    player_key,
-                )
-            game: Game = pickle.loads(game_data)
+            version: int
+            if game_status_text:
+                # the write was small enough to carry everything we need
+                time_played_text, _, game_data_text = game_status_text.partition(" ")
+                version = int(version_text)
+                time_played = float(time_played_text)
+                game_data = base64.b64decode(game_data_text)
+            else:
+                conn: asyncpg.Connection
+                async with self._connection_pool.acquire() as conn:
+                    game_data, time_played, version = await conn.fetchrow(
+                        _SQL_GET_GAME_STATUS,
+                        player_key,
+                    )
+            # unpickling is comparatively expensive, so do it off of the event
+            # loop in order to keep serving other clients in the meantime
+            game: Game = await asyncio.get_running_loop().run_in_executor(
+                None, pickle.loads, game_data
+            )
 
         except Exception as e:
             raise Exception(
@@ -524,19 +996,35 @@ class DbManager:
 
         else:
             await self._game_status_callback(player_key, game, time_played)
+            # only now that the game has been delivered, as the callback can
+            # fail, in which case a notification for the same version must
+            # still get through. guard against an unsubscribe having happened
+            # in the meantime, which would otherwise leave a stale entry behind
+            if player_key in self._subscribed_keys:
+                self._last_version[player_key] = version
 
     async def _chat_consumer(self, player_key: str, payload: str) -> None:
         message_id = int(payload) if payload else None
+        last_id = self._last_chat_id.get(player_key)
+        if last_id is None:
+            # the recipient hasn't been sent the full thread yet, e.g. a message
+            # arrived between subscribing and the forced fetch which follows
+            # joining a game, so a single message would leave it without the
+            # rest of the thread. send the lot instead
+            message_id = None
+        elif message_id is not None and message_id <= last_id:
+            # already delivered as part of a thread, e.g. the one just above
+            return
+        after_id = last_id if message_id is None else None
 
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
                 rows: List[asyncpg.Record] = await conn.fetch(
-                    """
-                    SELECT * FROM get_chat_updates($1, $2);
-                    """,
+                    _SQL_GET_CHAT_UPDATES,
                     player_key,
                     message_id,
+                    after_id,
                 )
 
         except Exception as e:
@@ -546,11 +1034,28 @@ class DbManager:
             ) from e
 
         else:
-            thread = ChatThread()
-            thread.is_complete = message_id is None
-            for id, timestamp, color, message in rows:
-                thread.append(ChatMessage(timestamp, Color[color], message, id))
+            if not rows and after_id is not None:
+                # the recipient is already up to date
+                return
+
+            # rows are (id, time_stamp, color, message). index them directly
+            # rather than unpacking, which goes through the iterator protocol
+            thread = ChatThread(
+                [
+                    ChatMessage(row[1], _COLORS_BY_NAME[row[2]], row[3], row[0])
+                    for row in rows
+                ],
+                message_id is None and after_id is None,
+            )
             await self._chat_callback(player_key, thread)
+            # only now that the thread has been delivered, as the callback can
+            # fail, e.g. when the key's client isn't registered yet, in which
+            # case the next forced fetch must send it again. as in the game
+            # status consumer, guard against an unsubscribe in the meantime
+            if player_key in self._subscribed_keys:
+                self._last_chat_id[player_key] = max(
+                    last_id or 0, rows[-1][0] if rows else 0
+                )
 
     async def _opponent_connected_consumer(self, player_key: str, payload: str) -> None:
         if payload:
@@ -560,9 +1065,7 @@ class DbManager:
                 conn: asyncpg.Connection
                 async with self._connection_pool.acquire() as conn:
                     connected: bool = await conn.fetchval(
-                        """
-                        SELECT * FROM get_opponent_connected($1);
-                        """,
+                        _SQL_GET_OPPONENT_CONNECTED,
                         player_key,
                     )
 
@@ -581,21 +1084,26 @@ class DbManager:
         otherwise
         """
 
+        # snapshot the game once up front. the bytes are immutable, so they are
+        # safe to reuse should the write ever need to be reattempted, and
+        # pickling is by far the most expensive part of this method, so it is
+        # done in the default executor to keep serving other clients meanwhile.
+        # this is safe because nothing mutates `game` while we await: each
+        # client's messages are handled one at a time, and updates from the
+        # opponent replace a client's game rather than modifying it
         version = game.version()
+        game_data = await asyncio.get_running_loop().run_in_executor(None, game.pickled)
         log_text = f"game for player key {player_key} to version {version}"
 
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
-                async with conn.transaction():
-                    time_played: Optional[float] = await conn.fetchval(
-                        """
-                        SELECT * FROM write_game($1, $2, $3);
-                        """,
-                        player_key,
-                        pickle.dumps(game),
-                        version,
-                    )
+                time_played: Optional[float] = await conn.fetchval(
+                    _SQL_WRITE_GAME,
+                    player_key,
+                    game_data,
+                    version,
+                )
 
         except Exception as e:
             raise Exception(f"Failed to update {log_text}") from e
@@ -617,15 +1125,12 @@ class DbManager:
         try:
             conn: asyncpg.Connection
             async with self._connection_pool.acquire() as conn:
-                async with conn.transaction():
-                    res = await conn.fetchval(
-                        """
-                        SELECT * FROM write_chat($1, $2, $3);
-                        """,
-                        message.timestamp,
-                        message.message,
-                        player_key,
-                    )
+                res = await conn.fetchval(
+                    _SQL_WRITE_CHAT,
+                    message.timestamp,
+                    message.message,
+                    player_key,
+                )
 
         except Exception as e:
             raise Exception(
@@ -646,15 +1151,14 @@ class DbManager:
 
     async def unsubscribe(self, player_key: str, listeners_only: bool = False) -> bool:
         """
-        Attempt to unsubscribe from channels associated with `player_key` and
-        modify the row in the `player_key` table appropriately. Return True on
+        Attempt to stop accepting updates for `player_key` and modify the row in
+        the `player_key` table appropriately. Return True on
         success and False if the database shows that this server is not managing
         `player_key`.
 
         If `listeners_only` is True, assume that `player_key` has already been
         unsubscribed by some other action, e.g. new or join game with
-        `key_to_unsubscribe` specified, and only remove any listeners on
-        channels associated with `player_key`.
+        `key_to_unsubscribe` specified, and only stop accepting its updates.
 
         Note that in contrast to other methods in this class, this method is not
         allowed to fail because of database inavailability, but instead sleeps
@@ -664,36 +1168,27 @@ class DbManager:
         will be run.
         """
 
-        # it's possible while we are looping that the db comes back up, and we
-        # are able to acquire a connection from the pool, but the listener
-        # connection has still not been reestablished. as such, we set res to
-        # None initially (or True if we weren't going to run the unsub action
-        # anyways) and then test it below to make sure that we only run the
-        # unsubscribe db function once
-        res = True if listeners_only else None
+        # even if the db somehow doesn't reflect that we were managing
+        # player_key, we should still stop accepting its updates. as this can't
+        # fail, do so up front, which also means that nothing arriving while we
+        # loop is delivered to a departing client
+        self._subscribed_keys.discard(player_key)
+        self._last_version.pop(player_key, None)
+        self._last_chat_id.pop(player_key, None)
+
+        if listeners_only:
+            logging.info(f"Successfully unsubscribed player key {player_key}")
+            return True
+
         while True:
             try:
-                if res is None:
-                    conn: asyncpg.Connection
-                    async with self._connection_pool.acquire() as conn:
-                        async with conn.transaction():
-                            res = await conn.fetchval(
-                                """
-                                SELECT * FROM unsubscribe($1, $2);
-                                """,
-                                player_key,
-                                self._machine_id,
-                            )
-
-                # even if the db somehow doesn't reflect that we were managing
-                # player_key, i.e. res is False, we should still unsub from any
-                # channels associated with it
-                async with self._listener_lock:
-                    for channel, callback in self._listening_channels[player_key]:
-                        await self._listener_connection.remove_listener(
-                            channel, callback
-                        )
-                    del self._listening_channels[player_key]
+                conn: asyncpg.Connection
+                async with self._connection_pool.acquire() as conn:
+                    res = await conn.fetchval(
+                        _SQL_UNSUBSCRIBE,
+                        player_key,
+                        self._machine_id,
+                    )
 
             except:
                 logging.exception(
@@ -1,3 +1,4 @@
+from __future__ import annotations
 from enum import Enum, auto
 from igo.aiserver import start_ai_player
 from .constants import (
@@ -22,7 +23,6 @@ from .messages import (
     OutgoingMessage,
     OutgoingMessageType,
 )
-from asyncinit import asyncinit
 from .db_manager import DbManager, JoinResult
 from .containers import (
     ActionResponseContainer,
@@ -40,7 +40,6 @@ class OppponentType(Enum):
     computer = auto()
 
 
-@asyncinit
 class GameStore:
     """
     GameStore is the guts of the in-memory storage and management of games. It
@@ -54,12 +53,27 @@ class GameStore:
 
     __slots__ = ("_clients", "_player_keys", "_db_manager")
 
-    async def __init__(
-        self, store_dsn: str, run_db_setup_scripts: bool = False
-    ) -> None:
+    @classmethod
+    async def create(
+        cls, store_dsn: str, run_db_setup_scripts: bool = False
+    ) -> GameStore:
+        """
+        Create and return a ready-to-use game store. As set up requires awaiting
+        the database, use this in place of the constructor
+        """
+
+        self: GameStore = cls.__new__(cls)
+        await self._async_init(store_dsn, run_db_setup_scripts)
+        return self
+
+    async def _async_init(self, store_dsn: str, run_db_setup_scripts: bool) -> None:
+        """
+        The actual meat of `create`. See its documentation for details
+        """
+
         self._clients: Dict[WebSocketHandler, ClientData] = {}
         self._player_keys: Dict[str, WebSocketHandler] = {}
-        self._db_manager: DbManager = await DbManager(
+        self._db_manager: DbManager = await DbManager.create(
             self._get_game_updater(),
             self._get_chat_updater(),
             self._get_opponent_connected_updater(),
@@ -405,7 +419,6 @@ class GameStore:
             logging.info("Client with no active subscriptions dropped")
 
 
-@asyncinit
 class GameManager:
     """
     GameManager is the simplified Game API to the connection_manager module.
@@ -418,16 +431,22 @@ class GameManager:
 
     __slots__ = "store"
 
-    async def __init__(
-        self, store_dsn: str, run_db_setup_scripts: bool = False
-    ) -> None:
+    @classmethod
+    async def create(
+        cls, store_dsn: str, run_db_setup_scripts: bool = False
+    ) -> GameManager:
         """
+        Create and return a ready-to-use game manager. As set up requires
+        awaiting the database, use this in place of the constructor
+
         Arguments:
 
             store_dsn: str - the data source name url of the store database
         """
 
-        self.store: GameStore = await GameStore(store_dsn, run_db_setup_scripts)
+        self: GameManager = cls.__new__(cls)
+        self.store: GameStore = await GameStore.create(store_dsn, run_db_setup_scripts)
+        return self
 
     async def unsubscribe(self, socket: WebSocketHandler) -> None:
         """Unsubscribe the socket from its key if it is subscribed, otherwise
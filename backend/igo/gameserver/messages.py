@@ -196,7 +196,9 @@ class OutgoingMessage(JsonifyableBaseDataClass):
                 # instead
                 f" to {self.websocket_handler.id}"
             )
-            logging.debug(f"Message data: {msg}")
+            # every outgoing message passes through here, and a game status can be
+            # large, so leave formatting to logging in case debug is disabled
+            logging.debug("Message data: %s", msg)
             return True
         except WebSocketClosedError as e:
             # this is known to happen after a period of database inavailability and
@@ -33,6 +33,7 @@ from .constants import (
 import asyncio
 import multiprocessing as mp
 import numpy as np
+import uvloop
 
 
 define("host", default="localhost", help="connect to the given host address", type=str)
@@ -96,6 +97,9 @@ def play_many(pid: int) -> List[timedelta]:
             ]
         )
 
+    # as in the servers. otherwise, the load generator's own event loop can
+    # become the bottleneck being measured
+    uvloop.install()
     return asyncio.run(tasks())
 
 
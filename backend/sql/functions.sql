@@ -1,3 +1,33 @@
+-- every game server listens on a single channel, derived from its manager id,
+-- and receives updates for all of the keys it manages there. payloads are
+-- "<update type> <player key> <update payload>". keys which aren't managed by
+-- anyone have no one to notify
+CREATE OR REPLACE FUNCTION notify_update(
+  key_to_notify char(10),
+  update_type text,
+  update_payload text
+)
+  RETURNS void
+  LANGUAGE plpgsql
+AS
+$$
+DECLARE
+  manager_id char(64);
+BEGIN
+  SELECT managed_by
+  FROM player_key
+  WHERE key = key_to_notify
+  INTO manager_id;
+
+  if manager_id is not null then
+    -- channel names must be shorter than 64 bytes, so only use half of the id
+    PERFORM pg_notify(
+      CONCAT('updates_', left(manager_id, 32)),
+      CONCAT_WS(' ', update_type, key_to_notify, update_payload)
+    );
+  end if;
+END $$;
+
 CREATE OR REPLACE FUNCTION join_game(
   key_to_join char(10),
   manager_id char(64),
@@ -86,11 +116,11 @@ BEGIN
       WHERE key = key_to_join
     );
 
-    PERFORM pg_notify((
-      SELECT CONCAT('opponent_connected_', opponent_key)
+    PERFORM notify_update((
+      SELECT opponent_key
       FROM player_key
       WHERE key = key_to_join
-      ), 'true');
+      ), 'opponent_connected', 'true');
 
     RETURN QUERY
       SELECT
@@ -121,6 +151,7 @@ DECLARE
   epoch_now double precision;
   updated_time_played double precision;
   gid integer;
+  payload text;
 BEGIN
   SELECT extract(epoch from now())
   INTO epoch_now;
@@ -140,11 +171,22 @@ BEGIN
   INTO updated_time_played;
 
   if found then
-    PERFORM pg_notify((
-      SELECT CONCAT('game_status_', opponent_key)
+    -- the payload is the version, followed by the time played and the base64
+    -- encoded game data if they fit, so that the listener can skip fetching
+    -- them. notify payloads must be shorter than 8000 bytes, including the
+    -- header added by notify_update, and base64 (with its line breaks) inflates
+    -- data by a little over 4/3
+    payload := version_to_write::text;
+    if octet_length(data_to_write) <= 5600 then
+      payload := CONCAT_WS(' ', payload, updated_time_played::text,
+        encode(data_to_write, 'base64'));
+    end if;
+
+    PERFORM notify_update((
+      SELECT opponent_key
       FROM player_key
       WHERE key = key_to_write
-    ), '');
+    ), 'game_status', payload);
 
     RETURN updated_time_played;
   end if;
@@ -183,11 +225,11 @@ BEGIN
     );
 
 
-    PERFORM pg_notify((
-      SELECT CONCAT('opponent_connected_', opponent_key)
+    PERFORM notify_update((
+      SELECT opponent_key
       FROM player_key
       WHERE key = key_to_unsubscribe
-      ), 'false');
+      ), 'opponent_connected', 'false');
 
     RETURN true;
   end if;
@@ -230,12 +272,12 @@ BEGIN
   -- game updates, where we know that if we successfully wrote our update, it is
   -- in fact the latest version, so there's no need to go back to the db to
   -- uselessly read in what we just wrote out
-  PERFORM pg_notify((SELECT CONCAT('chat_', author_key)), message_id);
-  PERFORM pg_notify((
-      SELECT CONCAT('chat_', opponent_key)
+  PERFORM notify_update(author_key, 'chat', message_id);
+  PERFORM notify_update((
+      SELECT opponent_key
       FROM player_key
       WHERE key = author_key
-  ), message_id);
+  ), 'chat', message_id);
 
   RETURN true;
 END $$;
@@ -265,11 +307,17 @@ BEGIN
   RETURN;
 END $$;
 
+-- the signature has changed, and CREATE OR REPLACE would otherwise leave the old
+-- version behind as an ambiguous overload
+DROP FUNCTION IF EXISTS get_chat_updates(char(10), integer);
+
 CREATE OR REPLACE FUNCTION get_chat_updates(
   associated_player_key char(10),
   -- get a single message if message_id is specified, otherwise get all messages
   -- for this key
-  message_id integer DEFAULT null
+  message_id integer DEFAULT null,
+  -- if specified, only get messages with ids strictly greater than after_id
+  after_id integer DEFAULT null
 )
   RETURNS TABLE (
     id integer,
@@ -305,6 +353,7 @@ BEGIN
     WHERE pk.key = associated_player_key
       AND pk.game_id = c.game_id
       AND CASE WHEN message_id is not null THEN c.id = message_id ELSE true END
+      AND CASE WHEN after_id is not null THEN c.id > after_id ELSE true END
     ORDER BY c.id;
 
   -- NOTE: having the above return nothing is a perfectly normal occurence when
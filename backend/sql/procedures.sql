@@ -85,7 +85,7 @@ CREATE OR REPLACE PROCEDURE trigger_update_all(
 AS
 $$
 BEGIN
-  PERFORM pg_notify((SELECT CONCAT('game_status_', key_to_notify)), '');
-  PERFORM pg_notify((SELECT CONCAT('chat_', key_to_notify)), '');
-  PERFORM pg_notify((SELECT CONCAT('opponent_connected_', key_to_notify)), '');
+  -- one notification, which the game server expands into a forced update of
+  -- every type, rather than one per type
+  PERFORM notify_update(key_to_notify, 'all', '');
 END $$;
\ No newline at end of file
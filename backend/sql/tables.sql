@@ -2,6 +2,9 @@ DROP TABLE IF EXISTS game, player_key, chat CASCADE;
 
 CREATE TABLE game (
   id serial PRIMARY KEY,
+  -- the pickled game. this must remain bytea: asyncpg sends and receives bytea
+  -- in postgres' binary format, so the data crosses the wire as-is and never
+  -- goes through bytea_output's hex (or escape) text encoding
   data bytea NOT NULL,
   version integer NOT NULL DEFAULT 0,
   players_connected integer NOT NULL DEFAULT 0,
@@ -4,11 +4,20 @@ from datetime import datetime
 from igo.gameserver.chat import ChatMessage, ChatThread
 import pickle
 from igo.game import Color, Game
-from igo.gameserver.db_manager import DbManager, JoinResult, _UpdateType
+from igo.gameserver.db_manager import (
+    ALPHANUM_CHARS,
+    DbManager,
+    JoinResult,
+    MAX_CONCURRENT_UPDATES,
+    _UpdateType,
+    alphanum_uuid,
+)
 import testing.postgresql
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 import asyncio
+import base64
+from collections import deque
 
 
 class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
@@ -42,7 +51,7 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         self.game_status_callback = AsyncMock()
         self.chat_callback = AsyncMock()
         self.opponent_connected_callback = AsyncMock()
-        self.manager: DbManager = await DbManager(
+        self.manager: DbManager = await DbManager.create(
             self.game_status_callback,
             self.chat_callback,
             self.opponent_connected_callback,
@@ -89,7 +98,7 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertIsNotNone(write_load_timestamp)
 
         del manager
-        manager: DbManager = await DbManager(
+        manager: DbManager = await DbManager.create(
             self.game_status_callback,
             self.chat_callback,
             self.opponent_connected_callback,
@@ -174,6 +183,28 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(game.version(), version)
         self.assertEqual(time_played, 0)
 
+    async def test_write_new_game_key_collision(self):
+        manager = self.manager
+        existing: KeyContainer = await manager.write_new_game(Game())
+        existing_keys = [existing[c].player_key for c in Color]
+        fresh_keys = ["0123456789", "9876543210"]
+
+        # colliding keys should be regenerated
+        with patch(
+            "igo.gameserver.db_manager.alphanum_uuid",
+            MagicMock(side_effect=existing_keys + fresh_keys),
+        ):
+            keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
+        self.assertEqual([keys[c].player_key for c in Color], fresh_keys)
+
+        # but not forever
+        with patch(
+            "igo.gameserver.db_manager.alphanum_uuid",
+            MagicMock(return_value=existing_keys[0]),
+        ):
+            with self.assertRaises(Exception):
+                await manager.write_new_game(Game(), Color.white)
+
     async def test_join_game(self):
         manager = self.manager
         new_game_keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
@@ -192,6 +223,18 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         await asyncio.sleep(0.1)
         self.opponent_connected_callback.assert_awaited_once()
 
+        # joining another game while leaving this one stops accepting the old
+        # key's updates as part of the join, rather than once it has committed
+        other_keys: KeyContainer = await manager.write_new_game(Game())
+        res, _ = await manager.join_game(
+            other_keys[Color.black].player_key, new_game_keys[Color.white].player_key
+        )
+        self.assertEqual(res, JoinResult.success)
+        self.assertIn(other_keys[Color.black].player_key, manager._subscribed_keys)
+        self.assertNotIn(
+            new_game_keys[Color.white].player_key, manager._subscribed_keys
+        )
+
     async def test_ai_secret(self):
         manager = self.manager
 
@@ -232,8 +275,44 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
     async def test_subscribe_to_updates(self):
         manager = self.manager
         key = "0123456789"
-        await manager._subscribe_to_updates(key)
-        self.assertEqual(len(manager._listening_channels[key]), len(_UpdateType))
+        manager._subscribe_to_updates(key)
+        self.assertIn(key, manager._subscribed_keys)
+        # notifications should be routed to the right update type and key, and
+        # only for subscribed keys
+        for update_type in _UpdateType:
+            for player_key in (key, "9876543210"):
+                manager._on_notify(
+                    manager._listener_connection,
+                    0,
+                    manager._update_channel,
+                    f"{update_type.name} {player_key} ",
+                )
+        self.assertEqual(
+            [manager._update_queue.get_nowait() for _ in _UpdateType],
+            [(update_type, key, "") for update_type in _UpdateType],
+        )
+        self.assertTrue(manager._update_queue.empty())
+
+    async def test_update_channel(self):
+        # updates for every key we manage should arrive on our update channel,
+        # without any per-key LISTEN
+        manager = self.manager
+        keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
+        key = keys[Color.white].player_key
+        with patch.object(DbManager, "_dispatch_update") as dispatch_mock:
+            async with manager._connection_pool.acquire() as conn:
+                await conn.execute("SELECT notify_update($1, 'chat', '1');", key)
+                # keys we don't manage have no one to notify
+                await conn.execute(
+                    "SELECT notify_update($1, 'chat', '1');",
+                    keys[Color.black].player_key,
+                )
+            for _ in range(50):
+                if dispatch_mock.await_count:
+                    break
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(0.1)
+            dispatch_mock.assert_awaited_once_with(_UpdateType.chat, key, "1")
 
     @patch("igo.gameserver.db_manager.pickle.dumps", MagicMock(return_value=b"1"))
     @patch("igo.gameserver.db_manager.pickle.loads", MagicMock(return_value=b"1"))
@@ -264,8 +343,8 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
             )
 
         # this is just right. we also want to make sure game status was fired,
-        # so subscribe to the opponent key
-        await manager._subscribe_to_updates(keys[Color.black].player_key)
+        # so join on the opponent key
+        await manager.join_game(keys[Color.black].player_key)
         with patch.object(Game, "version", return_value=1):
             self.assertGreater(
                 await manager.write_game(keys[Color.white].player_key, game), 0
@@ -273,6 +352,25 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         # see note on the suite class about timing-dependent tests
         await asyncio.sleep(0.1)
         self.game_status_callback.assert_awaited_once()
+        self.assertEqual(manager._last_version[keys[Color.black].player_key], 1)
+
+        # a notification for a version we've already fetched is dropped, but an
+        # empty payload always forces a fetch
+        await manager._game_status_consumer(keys[Color.black].player_key, "1")
+        self.game_status_callback.assert_awaited_once()
+        await manager._game_status_consumer(keys[Color.black].player_key, "")
+        self.assertEqual(self.game_status_callback.await_count, 2)
+
+        # a version is only recorded once the callback has delivered it, so
+        # should delivery fail, the same version still gets through next time
+        del manager._last_version[keys[Color.black].player_key]
+        self.game_status_callback.side_effect = AssertionError("not registered")
+        with self.assertRaises(AssertionError):
+            await manager._game_status_consumer(keys[Color.black].player_key, "")
+        self.assertNotIn(keys[Color.black].player_key, manager._last_version)
+        self.game_status_callback.side_effect = None
+        await manager._game_status_consumer(keys[Color.black].player_key, "1")
+        self.assertEqual(self.game_status_callback.await_count, 4)
 
     async def test_write_chat(self):
         manager = self.manager
@@ -283,7 +381,8 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
 
         self.assertTrue(await manager.write_chat(keys[Color.white].player_key, message))
         message.id = 1
-        thread = ChatThread([message])
+        # the first delivery to a key is always the full thread
+        thread = ChatThread([message], True)
         # see note on the suite class about timing-dependent tests
         await asyncio.sleep(0.1)
         self.chat_callback.assert_awaited_once_with(
@@ -291,30 +390,145 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         )
 
         # make sure that both players receive updates
-        await manager._subscribe_to_updates(keys[Color.black].player_key)
+        await manager.join_game(keys[Color.black].player_key)
         self.assertTrue(await manager.write_chat(keys[Color.black].player_key, message))
         await asyncio.sleep(0.1)
         # once for the first message, twice for the second after having subbed
         # to the other player's updates
         self.assertEqual(self.chat_callback.await_count, 3)
 
-    async def test_unsubscribe(self):
+        # having delivered both messages, a request for the full thread has
+        # nothing new to deliver
+        self.assertEqual(manager._last_chat_id[keys[Color.black].player_key], 2)
+        await manager._chat_consumer(keys[Color.black].player_key, "")
+        self.assertEqual(self.chat_callback.await_count, 3)
+        # but only what is new once there is something. simulate having missed
+        # the notification for a third message, e.g. during a listener outage
+        message.id = None
+        self.assertTrue(await manager.write_chat(keys[Color.white].player_key, message))
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.chat_callback.await_count, 5)
+        manager._last_chat_id[keys[Color.black].player_key] = 2
+        await manager._chat_consumer(keys[Color.black].player_key, "")
+        message.id = 3
+        self.chat_callback.assert_awaited_with(
+            keys[Color.black].player_key, ChatThread([message])
+        )
+
+    async def test_chat_before_full_thread(self):
         manager = self.manager
         keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
-        self.assertEqual(
-            len(manager._listening_channels[keys[Color.white].player_key]), 3
+        white_key, black_key = (keys[c].player_key for c in (Color.white, Color.black))
+        first = ChatMessage(datetime.now().timestamp(), Color.white, "hi bob")
+        self.assertTrue(await manager.write_chat(white_key, first))
+
+        # when the opponent chats after black subscribes but before the forced
+        # fetch that follows joining, black is sent the full thread, history
+        # included, rather than just the new message
+        await manager.join_game(black_key)
+        second = ChatMessage(datetime.now().timestamp(), Color.white, "hi alice")
+        self.assertTrue(await manager.write_chat(white_key, second))
+        # see note on the suite class about timing-dependent tests
+        await asyncio.sleep(0.1)
+        first.id, second.id = 1, 2
+        self.chat_callback.assert_any_await(
+            black_key, ChatThread([first, second], True)
         )
+        self.assertEqual(manager._last_chat_id[black_key], 2)
+
+        # after which neither the forced fetch nor a late notification for a
+        # message already sent delivers anything
+        self.chat_callback.reset_mock()
+        await manager._chat_consumer(black_key, "")
+        await manager._chat_consumer(black_key, "2")
+        self.chat_callback.assert_not_awaited()
+
+    async def test_chat_callback_failure(self):
+        manager = self.manager
+        keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
+        white_key = keys[Color.white].player_key
+        message = ChatMessage(datetime.now().timestamp(), Color.white, "hi bob")
+
+        # e.g. the key's client not being registered yet. the failure is logged
+        # by _dispatch_update, and the thread isn't recorded as delivered
+        self.chat_callback.side_effect = AssertionError("not registered")
+        self.assertTrue(await manager.write_chat(white_key, message))
+        # see note on the suite class about timing-dependent tests
+        await asyncio.sleep(0.1)
+        self.chat_callback.assert_awaited_once()
+        self.assertNotIn(white_key, manager._last_chat_id)
+
+        # so the next forced fetch sends the whole thread again
+        self.chat_callback.reset_mock(side_effect=True)
+        await manager._chat_consumer(white_key, "")
+        message.id = 1
+        self.chat_callback.assert_awaited_once_with(
+            white_key, ChatThread([message], True)
+        )
+        self.assertEqual(manager._last_chat_id[white_key], 1)
+
+    async def test_unsubscribe(self):
+        manager = self.manager
+        keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
+        self.assertIn(keys[Color.white].player_key, manager._subscribed_keys)
         self.assertFalse(await manager.unsubscribe(keys[Color.black].player_key))
         self.assertTrue(await manager.unsubscribe(keys[Color.white].player_key))
-        self.assertEqual(
-            len(manager._listening_channels[keys[Color.white].player_key]), 0
-        )
+        self.assertNotIn(keys[Color.white].player_key, manager._subscribed_keys)
+
+    async def test_consumers_use_pool(self):
+        # each consumer should borrow a pooled connection via async with, which
+        # returns it to the pool once the consumer is done with it
+        manager = self.manager
+        game = Game()
+        conn = AsyncMock()
+        conn.fetchrow.return_value = (game.pickled(), 0.0, 0)
+        conn.fetch.return_value = []
+        conn.fetchval.return_value = True
+        pool = MagicMock()
+        pool.acquire.return_value.__aenter__.return_value = conn
+        key = "0123456789"
+
+        with patch.object(manager, "_connection_pool", pool):
+            await manager._game_status_consumer(key, "")
+            await manager._chat_consumer(key, "")
+            await manager._opponent_connected_consumer(key, "")
+
+        self.assertEqual(pool.acquire.call_count, 3)
+        self.assertEqual(pool.acquire.return_value.__aenter__.await_count, 3)
+        self.assertEqual(pool.acquire.return_value.__aexit__.await_count, 3)
+        self.game_status_callback.assert_awaited_once_with(key, game, 0.0)
+        self.chat_callback.assert_awaited_once_with(key, ChatThread(is_complete=True))
+        self.opponent_connected_callback.assert_awaited_once_with(key, True)
+
+    async def test_game_status_payload(self):
+        # a payload carrying the game shouldn't need the database at all
+        manager = self.manager
+        game = Game()
+        pool = MagicMock()
+        key = "0123456789"
+        manager._subscribed_keys.add(key)
+        payload = f"3 1.5 {base64.encodebytes(game.pickled()).decode()}"
+
+        with patch.object(manager, "_connection_pool", pool):
+            await manager._game_status_consumer(key, payload)
+
+        pool.acquire.assert_not_called()
+        self.game_status_callback.assert_awaited_once_with(key, game, 1.5)
+        self.assertEqual(manager._last_version[key], 3)
 
     async def test_trigger_update_all(self):
         manager = self.manager
         game = Game(1)
         keys: KeyContainer = await manager.write_new_game(game, Color.white)
-        await manager.trigger_update_all(keys[Color.white].player_key)
+        # keys we manage are updated without a trip to the database
+        with patch.object(
+            DbManager,
+            "_enqueue_update_all",
+            autospec=True,
+            side_effect=DbManager._enqueue_update_all,
+        ) as enqueue_mock:
+            await manager.trigger_update_all(keys[Color.white].player_key)
+        enqueue_mock.assert_called_once_with(manager, keys[Color.white].player_key)
         # see note on the suite class about timing-dependent tests
         await asyncio.sleep(0.1)
         self.game_status_callback.assert_awaited_once_with(
@@ -327,15 +541,17 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
             keys[Color.white].player_key, False
         )
 
-    @patch.object(DbManager, "trigger_update_all")
-    async def test_db_reconnect(self, trigger_update_all_mock: AsyncMock):
+    @patch.object(DbManager, "_dispatch_update")
+    async def test_db_reconnect(self, dispatch_update_mock: AsyncMock):
         manager = self.manager
         keys: KeyContainer = await manager.write_new_game(Game(), Color.white)
         # losing the db connection logs a bunch of errors, which just clutters
         # the test output. note that 50 is CRITICAL per
         # https://docs.python.org/3/howto/logging.html#logging-levels, so this
-        # disables all logging
+        # disables all logging. it is reenabled afterwards, as later tests
+        # assert on what is logged
         logging.disable(50)
+        self.addCleanup(logging.disable, logging.NOTSET)
         # terminate, *not* stop, which also cleans up the tmp file that
         # testing.postgresql uses, rendering it unable to be restarted
         self.__class__.postgresql.terminate()
@@ -348,4 +564,276 @@ class DbManagerTestCase(unittest.IsolatedAsyncioTestCase):
         # see note on the suite class about timing-dependent tests
         await asyncio.sleep(0.1)
         self.assertFalse(manager._listener_connection.is_closed())
-        trigger_update_all_mock.assert_awaited_once_with(keys[Color.white].player_key)
+        # every update should have been forced for the subscribed key
+        self.assertEqual(
+            [c.args for c in dispatch_update_mock.await_args_list],
+            [
+                (update_type, keys[Color.white].player_key, "")
+                for update_type in _UpdateType
+            ],
+        )
+
+
+class CoalesceUpdatesTestCase(unittest.TestCase):
+    def test_coalesce_updates(self):
+        key_1, key_2 = "0123456789", "9876543210"
+        coalesce = DbManager._coalesce_updates
+
+        # game status is always fetched in full, so repeats are redundant
+        self.assertEqual(
+            coalesce([(_UpdateType.game_status, key_1, "")] * 3),
+            [(_UpdateType.game_status, key_1, "")],
+        )
+        # otherwise, only the latest version is kept, but a forced fetch can't
+        # be replaced by a version
+        self.assertEqual(
+            coalesce(
+                [
+                    (_UpdateType.game_status, key_1, "1"),
+                    (_UpdateType.game_status, key_1, "2"),
+                ]
+            ),
+            [(_UpdateType.game_status, key_1, "2")],
+        )
+        self.assertEqual(
+            coalesce(
+                [
+                    (_UpdateType.game_status, key_1, ""),
+                    (_UpdateType.game_status, key_1, "2"),
+                ]
+            ),
+            [(_UpdateType.game_status, key_1, "")],
+        )
+        # opponent connected keeps only the latest state
+        self.assertEqual(
+            coalesce(
+                [
+                    (_UpdateType.opponent_connected, key_1, "false"),
+                    (_UpdateType.opponent_connected, key_1, "true"),
+                ]
+            ),
+            [(_UpdateType.opponent_connected, key_1, "true")],
+        )
+        # distinct chat messages are all kept, in order, but duplicates aren't
+        self.assertEqual(
+            coalesce(
+                [
+                    (_UpdateType.chat, key_1, "1"),
+                    (_UpdateType.chat, key_1, "2"),
+                    (_UpdateType.chat, key_1, "1"),
+                ]
+            ),
+            [(_UpdateType.chat, key_1, "1"), (_UpdateType.chat, key_1, "2")],
+        )
+        # a full chat thread subsumes individual messages
+        self.assertEqual(
+            coalesce(
+                [
+                    (_UpdateType.chat, key_1, "1"),
+                    (_UpdateType.chat, key_1, ""),
+                    (_UpdateType.chat, key_1, "2"),
+                ]
+            ),
+            [(_UpdateType.chat, key_1, "")],
+        )
+        # and nothing is coalesced across player keys or update types
+        updates = [
+            (_UpdateType.game_status, key_1, ""),
+            (_UpdateType.game_status, key_2, ""),
+            (_UpdateType.chat, key_1, ""),
+            (_UpdateType.opponent_connected, key_1, ""),
+        ]
+        self.assertEqual(coalesce(updates), updates)
+
+
+class UpdateConsumerTestCase(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def _create_manager(queue_max_size: int = 0) -> DbManager:
+        """
+        Consuming updates doesn't touch the database, so skip DbManager.create
+        and set up only the attributes that queueing and consuming updates
+        need, with an update queue of `queue_max_size` (unbounded if 0)
+        """
+
+        manager: DbManager = DbManager.__new__(DbManager)
+        manager._subscribed_keys = set()
+        manager._update_queue = asyncio.Queue(maxsize=queue_max_size)
+        manager._update_overflow = {}
+        manager._chat_overflow = deque()
+        manager._overflowed_updates = 0
+        manager._update_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPDATES)
+        manager._update_tasks = {}
+        manager._pending_updates = {}
+        manager._update_batch_tasks = set()
+        return manager
+
+    async def test_update_consumer(self):
+        manager = self._create_manager()
+        key_1, key_2 = "0123456789", "9876543210"
+
+        def dispatch(update_type: _UpdateType, player_key: str, payload: str):
+            if player_key == key_1:
+                raise Exception("oops")
+
+        with patch.object(
+            DbManager, "_dispatch_update", AsyncMock(side_effect=dispatch)
+        ) as dispatch_mock:
+            for update in (
+                (_UpdateType.game_status, key_1, ""),
+                (_UpdateType.chat, key_2, "1"),
+                (_UpdateType.game_status, key_1, ""),
+                (_UpdateType.chat, key_2, "2"),
+            ):
+                manager._update_queue.put_nowait(update)
+            consumer = asyncio.create_task(manager._update_consumer())
+
+            # all four updates should be drained and coalesced into three
+            # dispatches, and the exception for key_1 shouldn't affect key_2
+            with self.assertLogs(level="ERROR"):
+                await asyncio.wait_for(manager._update_queue.join(), 1)
+            self.assertEqual(
+                [c.args for c in dispatch_mock.await_args_list],
+                [
+                    (_UpdateType.game_status, key_1, ""),
+                    (_UpdateType.chat, key_2, "1"),
+                    (_UpdateType.chat, key_2, "2"),
+                ],
+            )
+
+            # nor should it have killed the consumer
+            manager._update_queue.put_nowait((_UpdateType.chat, key_2, "3"))
+            await asyncio.wait_for(manager._update_queue.join(), 1)
+            dispatch_mock.assert_awaited_with(_UpdateType.chat, key_2, "3")
+
+            consumer.cancel()
+        self.assertEqual(manager._update_tasks, {})
+
+    async def test_update_consumer_slow_key(self):
+        manager = self._create_manager()
+        key_1, key_2 = "0123456789", "9876543210"
+        unblock = asyncio.Event()
+        dispatched = []
+
+        async def dispatch(update_type: _UpdateType, player_key: str, payload: str):
+            if player_key == key_1 and payload == "1":
+                await unblock.wait()
+            dispatched.append((update_type, player_key, payload))
+
+        with patch.object(
+            DbManager, "_dispatch_update", AsyncMock(side_effect=dispatch)
+        ):
+            consumer = asyncio.create_task(manager._update_consumer())
+            # while key_1 is stuck, later updates for other keys still go
+            # through, but later updates for key_1 wait their turn. those which
+            # arrive while waiting are coalesced as if they were one batch
+            for update in (
+                (_UpdateType.chat, key_1, "1"),
+                (_UpdateType.chat, key_1, "2"),
+                (_UpdateType.game_status, key_1, ""),
+                (_UpdateType.chat, key_2, "1"),
+                (_UpdateType.game_status, key_1, ""),
+                (_UpdateType.chat, key_1, "2"),
+            ):
+                manager._update_queue.put_nowait(update)
+                await asyncio.sleep(0.01)
+            self.assertEqual(dispatched, [(_UpdateType.chat, key_2, "1")])
+            self.assertEqual(
+                manager._pending_updates,
+                {key_1: [(_UpdateType.chat, "2"), (_UpdateType.game_status, "")]},
+            )
+
+            unblock.set()
+            await asyncio.wait_for(manager._update_queue.join(), 1)
+            self.assertEqual(
+                dispatched,
+                [
+                    (_UpdateType.chat, key_2, "1"),
+                    (_UpdateType.chat, key_1, "1"),
+                    (_UpdateType.chat, key_1, "2"),
+                    (_UpdateType.game_status, key_1, ""),
+                ],
+            )
+            self.assertEqual(manager._update_tasks, {})
+            self.assertEqual(manager._pending_updates, {})
+
+            consumer.cancel()
+
+    async def test_update_queue_overflow(self):
+        manager = self._create_manager(queue_max_size=1)
+        key = "0123456789"
+        manager._subscribed_keys.add(key)
+        unblock = asyncio.Event()
+        dispatched = []
+
+        async def dispatch(update_type: _UpdateType, player_key: str, payload: str):
+            if update_type is _UpdateType.chat and payload == "1":
+                await unblock.wait()
+            dispatched.append((update_type, player_key, payload))
+
+        def notify(update_type_name: str, payload: str):
+            manager._on_notify(None, 0, "", f"{update_type_name} {key} {payload}")
+
+        with patch.object(
+            DbManager, "_dispatch_update", AsyncMock(side_effect=dispatch)
+        ):
+            consumer = asyncio.create_task(manager._update_consumer())
+            # hold up dispatching for the key on its first chat message
+            notify("chat", "1")
+            await asyncio.sleep(0.01)
+
+            # the next update takes the only place in the queue, and the rest
+            # overflow
+            for update_type_name, payload in (
+                ("opponent_connected", "true"),
+                ("game_status", ""),
+                ("game_status", "2"),
+                ("chat", "2"),
+                ("opponent_connected", "false"),
+                ("chat", "3"),
+            ):
+                notify(update_type_name, payload)
+            self.assertEqual(
+                manager.update_queue_stats(), {"queued": 5, "overflowed": 5}
+            )
+
+            # once the consumer has taken the queued update, and the overflow
+            # along with it, a later chat message takes the freed place without
+            # overtaking those which overflowed
+            await asyncio.sleep(0.01)
+            self.assertEqual(manager.update_queue_stats()["queued"], 0)
+            notify("chat", "4")
+
+            unblock.set()
+            await asyncio.wait_for(manager._update_queue.join(), 1)
+            consumer.cancel()
+
+        # nothing is lost: the forced game status fetch survives a later
+        # version, the chat messages are delivered in order, and opponent
+        # connected reports the latest state
+        self.assertEqual(
+            dispatched,
+            [
+                (_UpdateType.chat, key, "1"),
+                (_UpdateType.opponent_connected, key, "false"),
+                (_UpdateType.game_status, key, ""),
+                (_UpdateType.chat, key, "2"),
+                (_UpdateType.chat, key, "3"),
+                (_UpdateType.chat, key, "4"),
+            ],
+        )
+        self.assertEqual(manager._update_overflow, {})
+        self.assertEqual(manager._chat_overflow, deque())
+
+
+class AlphanumUuidTestCase(unittest.TestCase):
+    def test_alphanum_uuid(self):
+        for length in (1, 10):
+            uuid = alphanum_uuid(length)
+            self.assertEqual(len(uuid), length)
+            self.assertTrue(set(uuid) <= set(ALPHANUM_CHARS))
+        # see the alphanum_uuid docstring. at the maximum length, we sometimes
+        # run out of digits early
+        self.assertLessEqual(len(alphanum_uuid(22)), 22)
+        self.assertNotEqual(alphanum_uuid(), alphanum_uuid())
+        with self.assertRaises(AssertionError):
+            alphanum_uuid(23)
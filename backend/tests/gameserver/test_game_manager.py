@@ -11,7 +11,7 @@ from igo.gameserver.containers import (
 )
 from igo.gameserver.db_manager import DbManager
 import unittest
-from unittest.mock import AsyncMock, patch, Mock, MagicMock
+from unittest.mock import AsyncMock, patch, Mock
 from tornado.websocket import WebSocketHandler
 from igo.gameserver.game_manager import (
     ClientData,
@@ -52,13 +52,10 @@ class GameManagerUnitTestCase(unittest.IsolatedAsyncioTestCase):
     """
 
     async def asyncSetUp(self):
-        # NOTE: although DbManager.__init__ is async, unittest.mock doesn't seem
-        # to entirely understand what the @asyncinit decorator is doing, so it
-        # wants a synchronous mock instead
-        self.db_manager_mock = MagicMock(return_value=object())
+        self.db_manager_mock = AsyncMock(return_value=object())
         self.dsn = "postgres://foo@bar/baz"
-        with patch.object(DbManager, "__init__", self.db_manager_mock):
-            self.gm: GameManager = await GameManager(self.dsn)
+        with patch.object(DbManager, "create", self.db_manager_mock):
+            self.gm: GameManager = await GameManager.create(self.dsn)
 
     def test_init(self):
         # test that db manager created with correct url
@@ -147,7 +144,9 @@ class GameManagerIntegrationTestCase(unittest.IsolatedAsyncioTestCase):
         cls.postgresql.stop()
 
     async def asyncSetUp(self):
-        self.gm: GameManager = await GameManager(self.__class__.postgresql.url(), True)
+        self.gm: GameManager = await GameManager.create(
+            self.__class__.postgresql.url(), True
+        )
 
     async def asyncTearDown(self) -> None:
         await self.gm.store._db_manager._listener_connection.close()
@@ -299,22 +298,11 @@ class GameManagerIntegrationTestCase(unittest.IsolatedAsyncioTestCase):
         )
         # see note in test_db_manager about timing-dependent tests
         await asyncio.sleep(0.1)
-        # when we join using the second player key, triggering a notification on
-        # its opponent connected channel, we are still subscribed to the old
-        # key's channel. ideally, join/unsub/unlisten would all be
-        # transactional, but the design of the db_manager is such that there is
-        # a dedicated pub/sub connection alongside a pool that's used for
-        # everything else, so we can't make the whole sequence of operations
-        # transactional without a complicated two stage ("distributed") commit.
-        # as this is the only known consequence of not bundling in the
-        # unlistens, and as it is practically inconsequential, it seems
-        # reasonable to just let it slip through. we test for it here to record
-        # and explain the behavior
-        self.assertEqual(send_mock.call_count, 5)
-        self_subbed: OpponentConnectedContainer = init_mock.call_args_list[-5].args[1]
-        self.assertIsInstance(self_subbed, OpponentConnectedContainer)
-        self.assertTrue(self_subbed.opponent_connected)
-        # now starts the proper sequence. we receive the join response first
+        # joining using the second player key notifies its opponent, i.e. the
+        # old key, that it is connected. we stop accepting the old key's
+        # updates before the join commits, so that notification never reaches
+        # us, and the proper sequence starts with the join response
+        self.assertEqual(send_mock.call_count, 4)
         response: JoinGameResponseContainer = init_mock.call_args_list[-4].args[1]
         self.assertIsInstance(response, JoinGameResponseContainer)
         self.assertTrue(response.success)
@@ -408,15 +396,23 @@ class GameManagerIntegrationTestCase(unittest.IsolatedAsyncioTestCase):
         )
         await asyncio.sleep(0.1)
         self.assertEqual(send_mock.call_count, 3)
-        # game status should be sent to both players after the action response, so
-        # check the last three messages
-        msg_type, response, _ = init_mock.call_args_list[-3].args
-        self.assertIs(msg_type, OutgoingMessageType.game_action_response)
-        self.assertTrue(response.success)
-        msg_type, _, _ = init_mock.call_args_list[-2].args
-        self.assertIs(msg_type, OutgoingMessageType.game_status)
-        msg_type, _, _ = init_mock.call_args_list[-1].args
-        self.assertIs(msg_type, OutgoingMessageType.game_status)
+        # black should receive the action response and then game status, and
+        # white game status. small games are carried in the notification
+        # itself, so white's may well arrive before black's response
+        sent = init_mock.call_args_list[-3:]
+        to_black = [c.args[:2] for c in sent if c.args[2] is p2]
+        to_white = [c.args[:2] for c in sent if c.args[2] is p1]
+        self.assertEqual(
+            [msg_type for msg_type, _ in to_black],
+            [
+                OutgoingMessageType.game_action_response,
+                OutgoingMessageType.game_status,
+            ],
+        )
+        self.assertTrue(to_black[0][1].success)
+        self.assertEqual(
+            [msg_type for msg_type, _ in to_white], [OutgoingMessageType.game_status]
+        )
 
         # NOTE: it doesn't seem to be possible to test action preemption without
         # artificially preventing the player being preempted from receiving an
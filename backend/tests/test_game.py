@@ -1,4 +1,6 @@
+from copy import deepcopy
 from datetime import datetime
+import pickle
 from typing import Optional
 from igo.game import (
     Action,
@@ -114,6 +116,24 @@ class BoardTestCase(unittest.TestCase):
         b = Board()
         self.assertEqual(Board.deserialize(b.jsonifyable()), b)
 
+    def test_pickle(self):
+        b = Board(3)
+        b[0][0].color = Color.black
+        b[0][1].color = Color.white
+        b[0][1].marked_dead = True
+        b[2][2].counted = True
+        b[2][2].counts_for = Color.white
+        unpickled: Board = pickle.loads(pickle.dumps(b))
+        # Point.__eq__ only compares colors, so compare serializations instead
+        self.assertEqual(unpickled.jsonifyable(), b.jsonifyable())
+        # points must not be shared between positions
+        self.assertIsNot(unpickled[1][1], unpickled[1][2])
+
+        # boards pickled in the default format should still load
+        legacy: Board = Board.__new__(Board)
+        legacy.__setstate__((None, {"size": b.size, "_rows": deepcopy(b._rows)}))
+        self.assertEqual(legacy.jsonifyable(), b.jsonifyable())
+
 
 class GameTestCase(unittest.TestCase):
     def test_eq(self):
@@ -235,6 +255,10 @@ class GameTestCase(unittest.TestCase):
             success, msg = g.take_action(a)
         self.assertFalse(success)
         self.assertEqual(msg, "Playing at (2, 1) violates the simple ko rule")
+        # illegal moves are checked in place, so make sure nothing was left
+        # behind
+        self.assertIsNone(g.board[2][1].color)
+        self.assertIs(g.board[1][1].color, Color.white)
 
     def test_capture(self):
         g = Game(5)
@@ -700,6 +724,26 @@ class GameTestCase(unittest.TestCase):
         # docstring
         self.assertEqual(Game.deserialize(g.jsonifyable()), g)
 
+    def test_pickled(self):
+        g = Game()
+        pickled = g.pickled()
+        # unchanged games should reuse the cached pickle
+        self.assertIs(g.pickled(), pickled)
+        self.assertEqual(pickle.loads(pickled), g)
+        g.take_action(
+            Action(
+                ActionType.place_stone, Color.black, datetime.now().timestamp(), (0, 0)
+            )
+        )
+        # but any change in version should invalidate it
+        repickled = g.pickled()
+        self.assertIsNot(repickled, pickled)
+        unpickled: Game = pickle.loads(repickled)
+        self.assertEqual(unpickled, g)
+        # the cache itself should never be pickled
+        self.assertIsNone(unpickled._pickle_cache)
+        self.assertIsNone(deepcopy(g)._pickle_cache)
+
     def test_legal_moves(self):
         g = Game(3)
         g.board[0][1].color = Color.white
@@ -711,10 +755,13 @@ class GameTestCase(unittest.TestCase):
         g.board[2][0].color = Color.black
         g.board[1][1].color = Color.black
         g.board[0][2].color = Color.black
+        board = deepcopy(g.board)
         self.assertSetEqual(
             {(0, 0), (2, 1), (1, 2), (2, 2)},
             set(g.legal_moves(Color.black)),
         )
+        # dry runs leave the board as they found it
+        self.assertEqual(g.board, board)
         g = Game(3)
         g.board[0][1].color = Color.white
         g.board[1][0].color = Color.white